@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.signals import worker_process_init
 from app.config import settings
 
 # Create Celery instance
@@ -16,4 +17,25 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
-)
\ No newline at end of file
+    # Long-running ingest tasks: don't prefetch work a busy worker can't start,
+    # and only ack once the task finishes so a crashed worker's job is redelivered
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    beat_schedule={
+        # Qdrant has no TTL, so expire semantic answer cache entries periodically
+        'cleanup-answer-cache': {
+            'task': 'app.tasks.cleanup_answer_cache',
+            'schedule': 600.0,
+        },
+    },
+)
+
+@worker_process_init.connect
+def configure_worker_db_pool(**kwargs):
+    """
+    Give each Celery worker process its own small connection pool so workers
+    don't each hoard the API-sized pool (and don't share forked connections).
+    """
+    from app.database import SessionLocal, create_db_engine
+    SessionLocal.configure(bind=create_db_engine(pool_size=2, max_overflow=2))
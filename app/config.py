@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -14,9 +15,16 @@ class Settings(BaseSettings):
     redis_port: int
     redis_db: int
 
+    #Qdrant
+    qdrant_host: str = "127.0.0.1"
+    qdrant_port: int = 6333
+    qdrant_grpc_port: int = 6334
+
     #OpenAI
     openai_api_key: str
     embedding_model: str
+    embedding_batch_size: int = 128
+    embedding_concurrency: int = 4
     
     # Other settings
     debug: bool = False
@@ -26,4 +34,9 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = False
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build Settings once (reads .env and the environment) and reuse it"""
+    return Settings()
+
+settings = get_settings()
\ No newline at end of file
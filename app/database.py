@@ -4,6 +4,20 @@ from .config import settings
 
 DATABASE_URL = f"{settings.database_type}://{settings.database_username}:{settings.database_password}@{settings.database_host}:{settings.database_port}/{settings.database_name}"
 
-engine = create_engine(DATABASE_URL)
+def create_db_engine(pool_size: int = 20, max_overflow: int = 20):
+    """
+    Create the SQLAlchemy engine with a pool sized for concurrent API workers.
+    pool_pre_ping and pool_recycle drop stale connections before they are used.
+    """
+    return create_engine(
+        DATABASE_URL,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        future=True
+    )
+
+engine = create_db_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
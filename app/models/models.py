@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -21,17 +21,12 @@ class Chunk(Base):
     __tablename__ = "chunks"
     
     id = Column(Integer, primary_key=True, index=True)
-    document_id = Column(Integer, ForeignKey("documents.id"))
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
     ord = Column(Integer)  # Order of chunk in document
     text = Column(Text)
     page_start = Column(Integer)
     page_end = Column(Integer)
     token_count = Column(Integer)
 
-class Embedding(Base):
-    __tablename__ = "embeddings"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    chunk_id = Column(Integer, ForeignKey("chunks.id"))
-    vector_data = Column(Text)  # Store as JSON for now
-  
\ No newline at end of file
+    # Ordered chunk retrieval per document
+    __table_args__ = (Index('ix_chunks_doc_ord', 'document_id', 'ord'),)
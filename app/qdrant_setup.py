@@ -1,46 +1,93 @@
 #!/usr/bin/env python3
 """
-Helper script to set up Qdrant collection for embeddings
+Helper script to set up Qdrant collections for embeddings and the answer cache
 Run this after starting the Qdrant container
 """
 
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client.models import (
+    Distance,
+    VectorParams,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    HnswConfigDiff,
+    PayloadSchemaType,
+)
+from app.config import settings
+from app.vector_db import qdrant
 import sys
 
+def create_collection_if_missing(client: QdrantClient, collection_name: str, **collection_options):
+    """Create a 1536-dim COSINE collection unless it already exists"""
+    # Check if collection already exists
+    collections = client.get_collections()
+    if collection_name in [col.name for col in collections.collections]:
+        print(f"Collection '{collection_name}' already exists")
+        return
+    
+    # Create collection with 1536 dimensions (text-embedding-3-small)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(
+            size=1536,  # OpenAI text-embedding-3-small dimensions
+            distance=Distance.COSINE
+        ),
+        **collection_options
+    )
+    
+    print(f"✅ Collection '{collection_name}' created successfully!")
+    print(f"   - Dimensions: 1536")
+    print(f"   - Distance: COSINE")
+    print(f"   - Ready for vector search!")
+
+def create_payload_index_if_missing(client: QdrantClient, collection_name: str, field_name: str, field_schema: PayloadSchemaType = PayloadSchemaType.INTEGER):
+    """
+    Index a payload field used in search filters. Without an index Qdrant
+    checks the filter against candidate points' payloads during HNSW traversal;
+    with one it can plan the filtered search around the matching points.
+    """
+    payload_schema = client.get_collection(collection_name).payload_schema
+    if field_name in payload_schema:
+        return
+    
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name=field_name,
+        field_schema=field_schema
+    )
+    print(f"✅ Payload index on '{collection_name}.{field_name}' created")
+
 def setup_qdrant_collection():
-    """Create the embeddings collection in Qdrant"""
+    """
+    Create the embeddings and answer_cache collections in Qdrant.
+    Raises if Qdrant can't be reached, so callers decide how to fail.
+    """
+    # Collection for chunk embeddings. Binary quantization keeps a 1-bit
+    # copy of each vector in RAM (192B vs 6KB); searches rescore the
+    # candidates against the original float32 vectors.
+    create_collection_if_missing(
+        qdrant,
+        "embeddings",
+        quantization_config=BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=True)
+        ),
+        # Denser graph for better recall on 1536-dim vectors
+        hnsw_config=HnswConfigDiff(m=32, ef_construct=256, full_scan_threshold=10000),
+        on_disk_payload=True
+    )
+    # Every chunk search is filtered by document
+    create_payload_index_if_missing(qdrant, "embeddings", "document_id")
+    
+    # Collection for the semantic answer cache (question embedding -> answer)
+    create_collection_if_missing(qdrant, "answer_cache")
+    # Lookups filter by document; cleanup deletes by cached_at range
+    create_payload_index_if_missing(qdrant, "answer_cache", "document_id")
+    create_payload_index_if_missing(qdrant, "answer_cache", "cached_at")
+
+if __name__ == "__main__":
     try:
-        # Connect to Qdrant
-        client = QdrantClient(host="localhost", port=6333)
-        
-        # Create collection for embeddings
-        collection_name = "embeddings"
-        
-        # Check if collection already exists
-        collections = client.get_collections()
-        if collection_name in [col.name for col in collections.collections]:
-            print(f"Collection '{collection_name}' already exists")
-            return
-        
-        # Create collection with 1536 dimensions (text-embedding-3-small)
-        client.create_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(
-                size=1536,  # OpenAI text-embedding-3-small dimensions
-                distance=Distance.COSINE
-            )
-        )
-        
-        print(f"✅ Collection '{collection_name}' created successfully!")
-        print(f"   - Dimensions: 1536")
-        print(f"   - Distance: COSINE")
-        print(f"   - Ready for vector search!")
-        
+        setup_qdrant_collection()
     except Exception as e:
         print(f"❌ Error setting up Qdrant: {e}")
-        print("Make sure Qdrant is running on localhost:6333")
+        print(f"Make sure Qdrant is running on {settings.qdrant_host}:{settings.qdrant_port}")
         sys.exit(1)
-
-if __name__ == "__main__":
-    setup_qdrant_collection()
@@ -0,0 +1,8 @@
+import redis.asyncio
+from app.config import settings
+
+# Async client for use inside async routes so Redis calls don't block the event loop
+redis_async = redis.asyncio.Redis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db, decode_responses=True)
+
+# Returns raw bytes, for binary (msgpack) payloads
+redis_binary_async = redis.asyncio.Redis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db)
@@ -1,5 +1,7 @@
 import redis
 from app.config import settings
 
-redis_client = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db, decode_responses=True)
+# One pool per process, shared by every importer (Celery tasks, scripts)
+redis_pool = redis.ConnectionPool(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db, max_connections=32, decode_responses=True)
 
+redis_client = redis.Redis(connection_pool=redis_pool)
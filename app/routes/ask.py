@@ -1,17 +1,23 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.requests import Request
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List
 from app.utils.rate_limiting import check_rate_limit
 from app.utils.format_time import format_reset_time
+from app.utils.logger import api_logger
 from app.utils.enhanced_search import enhanced_search
-from app.utils.answer_generation import generate_answer_with_citations, Citation
-from app.utils.answer_generation import get_cached_answer, Citation
+from app.utils.embeddings import generate_single_embedding_async, is_fallback_embedding
+from app.utils.answer_generation import generate_answer_with_citations, Citation, CITATIONS_ADAPTER
+from app.utils.answer_generation import get_cached_answer, get_semantic_cached_answer
 
 router = APIRouter()
 
 class AskRequest(BaseModel):
-    question: str
+    # Immutable, ignore unknown fields, and bound question size for validation;
+    # questions are stripped first, so blank ones fail min_length
+    model_config = ConfigDict(extra='ignore', frozen=True, str_max_length=8192, str_strip_whitespace=True)
+
+    question: str = Field(min_length=1)
     document_id: int
 
 class AskResponse(BaseModel):
@@ -22,13 +28,14 @@ class AskResponse(BaseModel):
     status: str
 
 def get_client_ip(request: Request):
-    print(request.client.host)
+    api_logger.debug("Client IP resolved", ip=request.client.host)
     return request.client.host
 
-@router.post("/ask")
-def ask_question(request: AskRequest, ip_address: str = Depends(get_client_ip)):
-    
-    rate_limit_result = check_rate_limit(ip_address)
+async def enforce_rate_limit(ip_address: str = Depends(get_client_ip)):
+    """
+    Async dependency so the Redis rate-limit check runs on the event loop
+    """
+    rate_limit_result = await check_rate_limit(ip_address)
 
     if not rate_limit_result["allowed"]:
         raise HTTPException(
@@ -36,12 +43,28 @@ def ask_question(request: AskRequest, ip_address: str = Depends(get_client_ip)):
             detail=f"Rate limit exceeded. Please try again in {format_reset_time(rate_limit_result['reset_time'])} seconds."
         )
 
+@router.post("/ask", dependencies=[Depends(enforce_rate_limit)])
+async def ask_question(request: AskRequest):
+
     try:
-        # Check cache first before doing any expensive operations
-        cached_result = get_cached_answer(request.question)
+        # Exact-match cache first: a repeated question needs no embedding,
+        # question splitting, search or LLM call
+        cached_result = await get_cached_answer(request.question, request.document_id)
+        
+        query_embedding = None
+        if not cached_result:
+            # Embed the question once; reused for the semantic cache and enhanced search
+            query_embedding = await generate_single_embedding_async(request.question)
+            api_logger.debug("Embedding generated", dims=len(query_embedding))
+            
+            # Then the semantic cache, still before any expensive operations
+            # (a fallback embedding would only match other failed lookups)
+            if not is_fallback_embedding(query_embedding):
+                cached_result = await get_semantic_cached_answer(query_embedding, request.document_id)
+        
         if cached_result:
-            print(f"Returning cached answer for question: {request.question[:50]}...")
-            citations = [Citation(**citation_dict) for citation_dict in cached_result["citations"]]
+            api_logger.info("Cache hit", document_id=request.document_id)
+            citations = CITATIONS_ADAPTER.validate_python(cached_result["citations"])
             return AskResponse(
                 question=request.question,
                 answer=cached_result["answer"],
@@ -51,15 +74,21 @@ def ask_question(request: AskRequest, ip_address: str = Depends(get_client_ip)):
             )
         
         # Cache miss - proceed with enhanced search and LLM generation
-        print(f"Cache miss - processing question with enhanced search: {request.question}")
-        similar_chunks = enhanced_search(
+        api_logger.info("Cache miss - processing question", document_id=request.document_id)
+        similar_chunks = await enhanced_search(
             question=request.question,
-            document_id=request.document_id
+            document_id=request.document_id,
+            query_embedding=query_embedding
         )
-        print(f"Enhanced search found {len(similar_chunks)} similar chunks")
+        api_logger.debug("Enhanced search complete", chunks=len(similar_chunks))
         
         # Generate answer with citations
-        answer, citations = generate_answer_with_citations(request.question, similar_chunks, request.document_id)
+        answer, citations = await generate_answer_with_citations(
+            request.question,
+            similar_chunks,
+            request.document_id,
+            query_embedding=query_embedding
+        )
         
         return AskResponse(
             question=request.question,
@@ -70,7 +99,7 @@ def ask_question(request: AskRequest, ip_address: str = Depends(get_client_ip)):
         )
         
     except Exception as e:
-        print(f"Error in ask endpoint: {str(e)}")
+        api_logger.error("Error in ask endpoint", error=str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing question: {str(e)}"
@@ -2,86 +2,160 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, status, Depends
 from sqlalchemy.orm import Session
 from app.models.models import Document
 from app.dependencies import get_db
-from app.redis_client import redis_client
+from app.redis_async import redis_async
 from app.tasks import process_document
-import PyPDF2
-import io
+import pypdfium2 as pdfium
+from blake3 import blake3
 import hashlib
+from typing import BinaryIO, Optional
+import asyncio
+import threading
 
 
 router = APIRouter()
 
+MAX_FILE_SIZE = 10 * 1024 * 1024 # 10MB
+UPLOAD_READ_SIZE = 64 * 1024
+
+# PDFium is not thread-safe, even across different documents, so extractions
+# from concurrent requests take turns (still off the event loop)
+_PDFIUM_LOCK = threading.Lock()
+
+def _extract(content: BinaryIO) -> tuple[str, int]:
+  """
+  Extract text from a PDF with inline [PAGE:N] markers.
+  CPU-bound, so callers run it in a worker thread; every pdfium call,
+  including the closes, happens under _PDFIUM_LOCK.
+
+  Returns:
+    Tuple of (full_text, page_count)
+  """
+  with _PDFIUM_LOCK:
+    pdf = pdfium.PdfDocument(content)
+    try:
+      # Collect page segments with inline page markers, joined once at the end
+      parts = []
+      for page_num, page in enumerate(pdf):
+        textpage = page.get_textpage()
+        page_text = textpage.get_text_range()
+        textpage.close()
+        page.close()
+        if page_text.strip():  # Only add non-empty pages
+          parts.append(f"[PAGE:{page_num + 1}] {page_text}\n\n")
+      return "".join(parts), len(pdf)
+    finally:
+      pdf.close()
+
+def _digest(content: BinaryIO, hasher) -> str:
+  """
+  Hex digest of an upload, read in chunks from the start; rewinds afterwards.
+  Blocking file I/O, so callers run it in a worker thread.
+  """
+  content.seek(0)
+  while chunk := content.read(UPLOAD_READ_SIZE):
+    hasher.update(chunk)
+  content.seek(0)
+  return hasher.hexdigest()
+
+def _rekey_legacy_document(db: Session, legacy_hash: str, content_hash: str) -> Optional[int]:
+  """
+  Find a document stored under its SHA-256 hash and re-key it to BLAKE3.
+  Blocking database calls, so callers run it in a worker thread.
+
+  Returns:
+    The document id, or None if there is no such document
+  """
+  document = db.query(Document).filter(Document.content_hash == legacy_hash).first()
+  if not document:
+    return None
+  document_id = document.id
+  document.content_hash = content_hash
+  db.commit()
+  return document_id
+
+def _create_document(db: Session, **fields) -> Document:
+  """
+  Insert a document row and load it back (blocking, run in a worker thread)
+  """
+  document = Document(**fields)
+  db.add(document)
+  db.commit()
+  db.refresh(document)
+  return document
+
 @router.post("/ingest")
 async def ingest_document(file: UploadFile = File(...), db: Session = Depends(get_db)):
 
   if file.content_type != "application/pdf":
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File must be a PDF")
 
-  content = await file.read()
-  MAX_FILE_SIZE = 10 * 1024 * 1024 # 10MB
-
-  if len(content) > MAX_FILE_SIZE:
+  # Starlette has already received the whole body into the UploadFile's own
+  # spooled file, so check its size up front, then hash and parse that file
+  # in place instead of copying it. BLAKE3 is only used for idempotency.
+  file_size = file.size
+  if file_size > MAX_FILE_SIZE:
     raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File size exceeds the maximum allowed size of 10MB")
-
-  content_hash = hashlib.sha256(content).hexdigest()
+  upload = file.file
+  content_hash = await asyncio.to_thread(_digest, upload, blake3())
 
   #Idempotency check
   #Check Redis cache fist
-  cached_doc_id = redis_client.get(f"doc:hash:{content_hash}")
+  cached_doc_id = await redis_async.get(f"doc:bhash:{content_hash}")
 
-  # Add this right after line 30:
   print(f"DEBUG: content_hash = {content_hash}")
-  print(f"DEBUG: cache_key = doc:hash:{content_hash}")
-  cached_doc_id = redis_client.get(f"doc:hash:{content_hash}")
+  print(f"DEBUG: cache_key = doc:bhash:{content_hash}")
   print(f"DEBUG: cached_doc_id = {cached_doc_id} (type: {type(cached_doc_id)})")
 
+  # Database calls block, so like /jobs they run in worker threads
   if cached_doc_id:
-    doc = db.query(Document).filter(Document.id == int(cached_doc_id)).first()
+    doc_status = await asyncio.to_thread(
+      db.query(Document.status).filter(Document.id == int(cached_doc_id)).scalar
+    )
     return {
       "document_id": int(cached_doc_id),
-      "status": doc.status,
+      "status": doc_status,
       "message": "Document already ingested Cached"
     }
 
   #Check database second
-  existing_document = db.query(Document).filter(Document.content_hash == content_hash).first()
+  existing_id = await asyncio.to_thread(
+    db.query(Document.id).filter(Document.content_hash == content_hash).scalar
+  )
 
-  if existing_document:
+  if not existing_id:
+    # Documents ingested before the switch to BLAKE3 carry a SHA-256 hash.
+    # Re-key a match to BLAKE3 so later uploads find it directly (and in Redis)
+    legacy_hash = await asyncio.to_thread(_digest, upload, hashlib.sha256())
+    existing_id = await asyncio.to_thread(_rekey_legacy_document, db, legacy_hash, content_hash)
+    if existing_id:
+      await redis_async.setex(f"doc:bhash:{content_hash}", 30*24*3600, str(existing_id))
+
+  if existing_id:
     return {
-      "document_id": existing_document.id,
+      "document_id": existing_id,
       "status": "already_ingested db",
       "content_hash": content_hash
     }
 
   #If not in cache or db, process new the PDF file
   try:
-    pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-    
-    # Create concatenated text with inline page markers
-    full_text = ""
-    for page_num, page in enumerate(pdf_reader.pages):
-      page_text = page.extract_text()
-      if page_text.strip():  # Only add non-empty pages
-        full_text += f"[PAGE:{page_num + 1}] {page_text}\n\n"
-    
+    full_text, page_count = await asyncio.to_thread(_extract, upload)
   except Exception as e:
     raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"Failed to read PDF file: {str(e)}")
 
   #Create new document record for database
-  document = Document(
+  document = await asyncio.to_thread(
+    _create_document,
+    db,
     content_hash=content_hash,
     title=file.filename or "Untitled Document",
-    pages=len(pdf_reader.pages),
-    bytes=len(content),
+    pages=page_count,
+    bytes=file_size,
     status="queued"
   )
 
-  db.add(document)
-  db.commit()
-  db.refresh(document)
-
   #Cache the document ID in Redis
-  redis_client.setex(f"doc:hash:{content_hash}", 30*24*3600, str(document.id)) #Cache for 1 hour
+  await redis_async.setex(f"doc:bhash:{content_hash}", 30*24*3600, str(document.id)) #Cache for 1 hour
 
   #Queue the document for processing
   process_document.delay(document.id, full_text)
@@ -1,13 +1,15 @@
 from fastapi import APIRouter, HTTPException, status, Depends
-from app.redis_client import redis_client
+from app.redis_async import redis_async
 from app.models.models import Document
 from app.dependencies import get_db
 from sqlalchemy.orm import Session
+import asyncio
+import orjson
 
 router = APIRouter()
 
 @router.get("/jobs/{job_id}")
-def get_job_status(job_id: str, db: Session = Depends(get_db)):
+async def get_job_status(job_id: str, db: Session = Depends(get_db)):
     """
     Get the status of a document processing job.
     
@@ -18,8 +20,10 @@ def get_job_status(job_id: str, db: Session = Depends(get_db)):
         Job status with progress information
     """
     try:
-        # Get document from database
-        document = db.query(Document).filter(Document.id == int(job_id)).first()
+        # Get document from database (blocking driver call, so off the event loop)
+        document = await asyncio.to_thread(
+            db.query(Document).filter(Document.id == int(job_id)).first
+        )
         if not document:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -28,11 +32,10 @@ def get_job_status(job_id: str, db: Session = Depends(get_db)):
         
         # Get job status from Redis
         job_key = f"job:{job_id}"
-        job_data = redis_client.get(job_key)
+        job_data = await redis_async.get(job_key)
         
         if job_data:
-            import json
-            job_info = json.loads(job_data)
+            job_info = orjson.loads(job_data)
             status_info = job_info.get('status', 'unknown')
             progress = job_info.get('progress', 0)
         else:
@@ -1,146 +1,297 @@
 from app.celery_app import celery_app
 from app.database import SessionLocal
 from app.models.models import Document, Chunk
+from sqlalchemy import insert, text
 from app.utils.chunking import smart_chunk_document
 from app.utils.embeddings import generate_embeddings
+from app.utils.answer_generation import cleanup_semantic_cache
 from app.redis_client import redis_client
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import PointStruct, FilterSelector
+from app.vector_db import qdrant
 from app.qdrant_setup import setup_qdrant_collection
-from typing import List, Dict
-import json
+from app.utils.vector_search import document_filter
+from app.config import settings
+from app.utils.logger import tasks_logger
+from typing import List, Dict, Iterable, Iterator
+import numpy as np
+from itertools import islice
+import asyncio
+import orjson
+import time
 
-@celery_app.task
-def process_document(document_id: int, full_text: str):
+JOB_STATUS_TTL = 3600  # 1 hour
+# Interior progress updates closer together than this are not worth a round-trip
+PROGRESS_MIN_INTERVAL = 0.1
+
+class JobProgress:
+    """
+    Mirrors a document's processing progress to Redis for /jobs polling.
+    """
+    def __init__(self, job_key: str):
+        self.job_key = job_key
+        self.last_write = None
+    
+    def write(self, job_data: Dict, final: bool = False):
+        """
+        Store job_data; skip interior updates that follow the previous write
+        within PROGRESS_MIN_INTERVAL. Final (ready/failed) updates always land.
+        """
+        now = time.monotonic()
+        if not final and self.last_write is not None and now - self.last_write < PROGRESS_MIN_INTERVAL:
+            return
+        redis_client.setex(self.job_key, JOB_STATUS_TTL, orjson.dumps(job_data))
+        self.last_write = now
+
+# Qdrant ingest sweet spot: small batches, a few requests in flight
+UPSERT_BATCH_SIZE = 64
+UPSERT_CONCURRENCY = 3
+
+async def upload_points(points: Iterable[PointStruct], batch_size: int = UPSERT_BATCH_SIZE, concurrency: int = UPSERT_CONCURRENCY):
+    """
+    Upsert points into the embeddings collection in batches, with a bounded
+    number of concurrent requests so network RTT overlaps server-side WAL writes.
+    
+    `points` may be a generator: batches are pulled from it as earlier ones
+    complete, so at most `concurrency` batches are held in memory at once.
+    
+    Uses gRPC, where vectors go over the wire as packed 4-byte floats rather
+    than JSON text, so the plain float lists in PointStruct cost no extra bytes.
     """
-    Background task to process a document
+    # Created per call: the async client is bound to the event loop that asyncio.run makes
+    client = AsyncQdrantClient(host=settings.qdrant_host, port=settings.qdrant_port, grpc_port=settings.qdrant_grpc_port, prefer_grpc=True)
+    points = iter(points)
+    pending = set()
+    
+    try:
+        while batch := list(islice(points, batch_size)):
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            # wait=False: don't block on indexing during bulk load
+            pending.add(asyncio.create_task(
+                client.upsert(collection_name="embeddings", points=batch, wait=False)
+            ))
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        for task in pending:
+            task.cancel()
+        await client.close()
+
+def iter_points(document_id: int, chunk_ids: List[int], chunks: List[Dict], embeddings: np.ndarray) -> Iterator[PointStruct]:
     """
-    print(f"Starting to process document {document_id}")
+    Yield one Qdrant point per stored chunk, keyed by its Postgres chunk id.
+    The payload carries everything search results need, so searches don't
+    go back to Postgres.
     
-    # Ensure Qdrant collection exists
-    setup_qdrant_collection()
+    Rows of the float32 embedding matrix become Python lists only here, one
+    point at a time, so just the in-flight upsert batches hold boxed floats.
+    """
+    for chunk_id, chunk_data, embedding_vector in zip(chunk_ids, chunks, embeddings):
+        yield PointStruct(
+            id=chunk_id,
+            vector=embedding_vector.tolist(),
+            payload={
+                "chunk_id": chunk_id,
+                "document_id": document_id,
+                "text": chunk_data['text'],
+                "page_start": chunk_data['page_start'],
+                "page_end": chunk_data['page_end'],
+                "token_count": chunk_data['token_count']
+            }
+        )
 
-    # Get database session
-    db = SessionLocal()
+def delete_document_points(document_id: int):
+    """
+    Remove a document's points from the embeddings collection. Used to clear
+    points left by an attempt whose chunk rows were never committed.
+    """
+    qdrant.delete(
+        collection_name="embeddings",
+        points_selector=FilterSelector(filter=document_filter(document_id)),
+        wait=True
+    )
+
+# Failed runs (e.g. a Qdrant outage) are retried with exponential backoff
+# before the document is marked failed
+PROCESS_MAX_RETRIES = 3
+PROCESS_RETRY_BACKOFF = 10  # seconds, doubled on each retry
+
+# Acked only after it finishes, so a crashed worker's document is redelivered;
+# safe to re-run because a document that already reached "ready" is skipped
+# and an unfinished one starts from a clean slate in Qdrant
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=PROCESS_MAX_RETRIES)
+def process_document(self, document_id: int, full_text: str):
+    """
+    Background task to process a document.
     
-    # Initialize Qdrant client
-    qdrant_client = QdrantClient(host="127.0.0.1", port=6333)
+    CPU- and network-bound work (chunking, embedding, the Qdrant upload) runs
+    with no database session open; sessions are only held for the short
+    status/insert writes. Chunks are committed together with the ready status,
+    so a redelivered task either finds the document ready or finds no chunks
+    for it; any points left by the earlier attempt are deleted before the
+    upload.
+    """
+    tasks_logger.info("Processing document", document_id=document_id)
+    
+    progress = JobProgress(f"job:{document_id}")
+    ready = False
     
     try:
-        # Get the document
-        document = db.query(Document).filter(Document.id == document_id).first()
-        if not document:
-            print(f"Document {document_id} not found")
+        # Ensure Qdrant collection exists; an unreachable Qdrant raises here
+        # and goes through the retry/failed path below
+        setup_qdrant_collection()
+        
+        # "processing" is only reported through Redis; Postgres is written once,
+        # when the chunks and the ready status are committed together
+        db = SessionLocal()
+        try:
+            found = db.query(Document.status).filter(Document.id == document_id).first()
+        finally:
+            db.close()
+        
+        if not found:
+            tasks_logger.warning("Document not found", document_id=document_id)
             return
         
-        # Update status to processing
-        document.status = "processing"
-        db.commit()
+        if found.status == "ready":
+            tasks_logger.info("Document already processed, skipping", document_id=document_id)
+            return
         
         # Update job progress in Redis
-        job_key = f"job:{document_id}"
         job_data = {
             "status": "processing",
             "progress": 20,
             "message": "Starting document processing..."
         }
-        redis_client.setex(job_key, 3600, json.dumps(job_data))  # 1 hour TTL
+        progress.write(job_data)
         
-        # Chunk with smart page-aware strategy
-        print("Chunking document with smart page-aware strategy...")
+        # Chunk with smart page-aware strategy (no DB session open)
+        tasks_logger.debug("Chunking document with smart page-aware strategy", document_id=document_id)
         chunks = smart_chunk_document(full_text)
-        print(f"Created {len(chunks)} chunks")
+        tasks_logger.info("Chunks created", document_id=document_id, count=len(chunks))
         
         # Update progress - chunking complete
         job_data["progress"] = 40
-        job_data["message"] = "Document chunking complete, storing chunks..."
-        redis_client.setex(job_key, 3600, json.dumps(job_data))
-
-        # Store chunks in database and prepare for embedding generation
-        chunk_ids = []
-        chunk_texts = []
-        
-        for chunk_data in chunks:
-            chunk = Chunk(
-                document_id=document_id,
-                ord=chunk_data['id'],
-                text=chunk_data['text'],
-                page_start=chunk_data['page_start'],
-                page_end=chunk_data['page_end'],
-                token_count=chunk_data['token_count']
-            )
-            db.add(chunk)
-            db.flush()  # Get the chunk.id from database
-            
-            # Track chunk IDs and texts for embedding generation
-            chunk_ids.append(chunk.id)
-            chunk_texts.append(chunk_data['text'])
-        
-        db.commit()
-        print("Chunks added to database")
-        
-        # Update progress - chunks stored
-        job_data["progress"] = 60
-        job_data["message"] = "Chunks stored, generating embeddings..."
-        redis_client.setex(job_key, 3600, json.dumps(job_data))
+        job_data["message"] = "Document chunking complete, generating embeddings..."
+        progress.write(job_data)
         
-        # Generate embeddings for all chunks
-        print(f"Generating embeddings for {len(chunk_texts)} chunks...")
+        # Generate embeddings for all chunks (no DB session open)
+        chunk_texts = [chunk_data['text'] for chunk_data in chunks]
+        tasks_logger.debug("Generating embeddings", document_id=document_id, count=len(chunk_texts))
         embeddings = generate_embeddings(chunk_texts)
-        print(f"Generated {len(embeddings)} embeddings")
+        tasks_logger.info("Embeddings generated", document_id=document_id, count=len(embeddings))
         
         # Update progress - embeddings generated
-        job_data["progress"] = 80
+        job_data["progress"] = 60
         job_data["message"] = "Embeddings generated, storing in vector database..."
-        redis_client.setex(job_key, 3600, json.dumps(job_data))
+        progress.write(job_data)
+        
+        # Points left by an earlier attempt (a crashed worker, a failed commit)
+        # have no chunk rows; drop them so a re-run doesn't index chunks twice
+        delete_document_points(document_id)
         
-        # Store embeddings in Qdrant
-        print("Storing embeddings in Qdrant...")
+        # Reserve a block of chunk ids up front in one round-trip, so the ids
+        # (used as Qdrant point ids) don't depend on the INSERT. Sequences
+        # aren't transactional, so the ids stay reserved when the session closes
+        db = SessionLocal()
         try:
-            points = []
-            for chunk_id, embedding_vector in zip(chunk_ids, embeddings):
-                point = PointStruct(
-                    id=chunk_id,
-                    vector=embedding_vector,
-                    payload={
-                        "chunk_id": chunk_id,
-                        "document_id": document_id
-                    }
-                )
-                points.append(point)
-            
-            qdrant_client.upsert(
-                collection_name="embeddings",
-                points=points
-            )
-            
-            print(f"Points: {points}")
-            print(f"Stored {len(embeddings)} embeddings in Qdrant")
-        except Exception as qdrant_error:
-            print(f"Qdrant error: {qdrant_error}")
+            chunk_ids = db.execute(
+                text("SELECT nextval('chunks_id_seq') FROM generate_series(1, :n)"),
+                {"n": len(chunks)}
+            ).scalars().all()
+        finally:
+            db.close()
+        
+        # Store embeddings in Qdrant with no database session held. Any failed
+        # batch propagates, so a partly indexed document is marked failed
+        tasks_logger.debug("Storing embeddings in Qdrant", document_id=document_id)
+        asyncio.run(upload_points(iter_points(document_id, chunk_ids, chunks, embeddings)))
+        tasks_logger.debug("Upserted points to Qdrant", document_id=document_id, count=len(chunk_ids))
+        
+        # Update progress - vectors stored
+        job_data["progress"] = 80
+        job_data["message"] = "Vectors stored, storing chunks..."
+        progress.write(job_data)
+        
+        # Store chunks in one multi-row INSERT and mark the document ready in a
+        # single short transaction, committed on exit (rolled back if anything
+        # below raises)
+        with SessionLocal.begin() as db:
+            rows = [
+                {
+                    "id": chunk_id,
+                    "document_id": document_id,
+                    "ord": chunk_data['id'],
+                    "text": chunk_data['text'],
+                    "page_start": chunk_data['page_start'],
+                    "page_end": chunk_data['page_end'],
+                    "token_count": chunk_data['token_count']
+                }
+                for chunk_id, chunk_data in zip(chunk_ids, chunks)
+            ]
+            # Single executemany INSERT with client-assigned ids, no RETURNING
+            if rows:
+                db.execute(insert(Chunk), rows)
+            tasks_logger.debug("Chunks added to database", document_id=document_id, count=len(rows))
             
-        document.status = "ready"
-        db.commit()
-        print(f"Document {document_id} processing completed successfully")
+            # Chunks and the ready status are committed together
+            db.query(Document).filter(Document.id == document_id).update({"status": "ready"})
+        ready = True
+        tasks_logger.info("Document processing completed", document_id=document_id)
         
         # Update progress - completed
         job_data["status"] = "ready"
         job_data["progress"] = 100
         job_data["message"] = "Document processing complete!"
-        redis_client.setex(job_key, 3600, json.dumps(job_data))
+        progress.write(job_data, final=True)
         
     except Exception as e:
-        print(f"Document processing failed: {str(e)}")
-        document.status = "failed"
-        db.commit()
+        tasks_logger.error("Document processing failed", document_id=document_id, error=str(e), retries=self.request.retries)
+        if ready:
+            # Only the final progress write failed; the document is stored
+            return
+        
+        # Chunk rows from the failed transaction were already rolled back;
+        # remove the points uploaded for them too
+        try:
+            delete_document_points(document_id)
+        except Exception as qdrant_error:
+            tasks_logger.error("Qdrant cleanup failed", document_id=document_id, error=qdrant_error)
+        
+        if self.request.retries < self.max_retries:
+            # Still "processing" from the client's point of view
+            job_data = {
+                "status": "processing",
+                "progress": 0,
+                "message": f"Document processing failed, retrying: {str(e)}"
+            }
+            progress.write(job_data, final=True)
+            raise self.retry(exc=e, countdown=PROCESS_RETRY_BACKOFF * 2 ** self.request.retries)
+        
+        db = SessionLocal()
+        try:
+            db.query(Document).filter(Document.id == document_id).update({"status": "failed"})
+            db.commit()
+        finally:
+            db.close()
         
         # Update progress - failed
-        job_key = f"job:{document_id}"
         job_data = {
             "status": "failed",
             "progress": 0,
             "message": f"Document processing failed: {str(e)}"
         }
-        redis_client.setex(job_key, 3600, json.dumps(job_data))
-    finally:
-        db.close()
\ No newline at end of file
+        progress.write(job_data, final=True)
+
+@celery_app.task
+def cleanup_answer_cache():
+    """
+    Periodic task to expire old entries from the Qdrant answer cache
+    """
+    try:
+        cleanup_semantic_cache()
+    except Exception as e:
+        tasks_logger.error("Answer cache cleanup failed", error=str(e))
@@ -1,11 +1,37 @@
 from typing import List, Dict, Tuple, Optional
-from openai import OpenAI
+from openai import AsyncOpenAI
+from qdrant_client.models import Filter, FieldCondition, MatchValue, Range, PointStruct, FilterSelector
 from app.config import settings
-from app.redis_client import redis_client
-from pydantic import BaseModel
-import json
+from app.redis_async import redis_binary_async
+from app.vector_db import qdrant, get_async_qdrant
+from app.utils.vector_search import ChunkHit
+from app.utils.embeddings import is_fallback_embedding
+from pydantic import BaseModel, TypeAdapter
+import msgpack
 import hashlib
+import xxhash
 import re
+import time
+import uuid
+
+# Initialize OpenAI client once so its keep-alive connection pool is reused
+# (async: called from the /ask event loop)
+client = AsyncOpenAI(api_key=settings.openai_api_key)
+
+# Semantic answer cache (Qdrant collection of question_embedding -> answer)
+ANSWER_CACHE_COLLECTION = "answer_cache"
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+ANSWER_CACHE_TTL = 3600  # 1 hour
+
+# Question normalization
+_WHITESPACE_RE = re.compile(r'\s+')
+_PUNCTUATION_TABLE = str.maketrans('', '', '?.,"\'')
+
+# LLM response parsing: one pass for the ANSWER/CITATIONS sections, one for the quote lines
+_RESPONSE_RE = re.compile(r'ANSWER:\s*(?P<answer>.*?)\s*CITATIONS:\s*(?P<citations>.*)', re.DOTALL)
+# Quote lines mirror the old per-line parsing: strip whitespace (including a
+# CRLF's \r) possessively so "#" is tested after it, then drop "..." and '...'
+_QUOTE_LINE_RE = re.compile(r'^[^\S\n]*+(?!#)"*\'*(.*?)\'*"*[^\S\n]*$', re.MULTILINE)
 
 class Citation(BaseModel):
     text: str
@@ -15,6 +41,9 @@ class Citation(BaseModel):
     exact_text: str
     search_pages: List[int]
 
+# One compiled (de)serializer for citation lists, instead of per-instance .dict()/Citation(**c)
+CITATIONS_ADAPTER = TypeAdapter(List[Citation])
+
 def normalize_question(question: str) -> str:
     """
     Normalize a question for consistent caching.
@@ -23,15 +52,8 @@ def normalize_question(question: str) -> str:
     - Remove punctuation variations
     - Sort words for order independence
     """
-    # Convert to lowercase and strip
-    normalized = question.lower().strip()
-    
-    # Remove extra whitespace
-    normalized = re.sub(r'\s+', ' ', normalized)
-    
-    # Remove common punctuation variations
-    normalized = normalized.replace('?', '').replace('.', '').replace(',', '')
-    normalized = normalized.replace('"', '').replace("'", '')
+    # Lowercase, collapse whitespace, then drop punctuation in one C-level pass
+    normalized = _WHITESPACE_RE.sub(' ', question.lower().strip()).translate(_PUNCTUATION_TABLE)
     
     # Optional: Sort words for order independence (uncomment if desired)
     # words = normalized.split()
@@ -39,30 +61,39 @@ def normalize_question(question: str) -> str:
     
     return normalized
 
-def get_cached_answer(question: str) -> Optional[Dict]:
+def answer_cache_key(question: str, document_id: int) -> str:
+    """
+    Redis key for a question's cached answer, scoped to the document it was
+    asked against. xxh3 is much cheaper than MD5 and a cache key needs no
+    cryptographic strength; "v2" keeps it apart from the legacy MD5 keys.
+    """
+    normalized = normalize_question(question)
+    question_hash = xxhash.xxh3_64_hexdigest(normalized.encode())
+    return f"answer:v2:{document_id}:{question_hash}"
+
+async def get_cached_answer(question: str, document_id: int) -> Optional[Dict]:
     """
     Check Redis cache for a cached answer to the normalized question.
     
     Args:
         question: The user's question
+        document_id: Document ID the question is asked against
         
     Returns:
         Cached answer dict if found, None otherwise
     """
     try:
-        normalized = normalize_question(question)
-        question_hash = hashlib.md5(normalized.encode()).hexdigest()
-        cache_key = f"answer:{question_hash}"
+        cache_key = answer_cache_key(question, document_id)
         
-        cached_data = redis_client.get(cache_key)
+        cached_data = await redis_binary_async.get(cache_key)
         if cached_data:
-            return json.loads(cached_data)
+            return msgpack.unpackb(cached_data, raw=False)
         return None
         
     except Exception as e:
         return None
 
-def cache_answer(question: str, answer: str, citations: List[Citation], document_id: int, ttl: int = 3600):
+async def cache_answer(question: str, answer: str, citations: List[Citation], document_id: int, ttl: int = 3600):
     """
     Cache the answer in Redis with a TTL.
     
@@ -74,57 +105,152 @@ def cache_answer(question: str, answer: str, citations: List[Citation], document
         ttl: Time to live in seconds (default 1 hour)
     """
     try:
-        normalized = normalize_question(question)
-        question_hash = hashlib.md5(normalized.encode()).hexdigest()
-        cache_key = f"answer:{question_hash}"
+        cache_key = answer_cache_key(question, document_id)
         
-        # Convert citations to dict for JSON serialization
-        citations_dict = [citation.dict() for citation in citations]
+        # Convert citations to dict for serialization
+        citations_dict = CITATIONS_ADAPTER.dump_python(citations)
         
         cache_data = {
             "answer": answer,
             "citations": citations_dict,
             "document_id": document_id,
-            "cached_at": json.dumps(None),  # We could add timestamp if needed
+            "cached_at": int(time.time()),
         }
         
-        redis_client.setex(cache_key, ttl, json.dumps(cache_data))
+        # MessagePack: smaller and faster to encode/decode than JSON
+        await redis_binary_async.setex(cache_key, ttl, msgpack.packb(cache_data, use_bin_type=True))
         
     except Exception as e:
         pass
 
-def generate_answer_with_citations(question: str, chunks: List[Dict], document_id: int) -> Tuple[str, List[Citation]]:
+def answer_cache_point_id(question: str, document_id: int) -> str:
+    """
+    Deterministic Qdrant point id for a (document_id, normalized question) pair,
+    so re-asking the exact same question overwrites its cache entry.
+    """
+    normalized = normalize_question(question)
+    digest = hashlib.sha256(f"{document_id}:{normalized}".encode()).hexdigest()
+    return str(uuid.UUID(digest[:32]))
+
+async def get_semantic_cached_answer(query_embedding: List[float], document_id: int) -> Optional[Dict]:
+    """
+    Check the Qdrant answer cache for a semantically equivalent question.
+    
+    Args:
+        query_embedding: Embedding of the user's question
+        document_id: Document ID the question is asked against
+        
+    Returns:
+        Cached answer dict if a past question scores >= ANSWER_CACHE_SIMILARITY_THRESHOLD, None otherwise
+    """
+    try:
+        search_results = await get_async_qdrant().search(
+            collection_name=ANSWER_CACHE_COLLECTION,
+            query_vector=query_embedding,
+            query_filter=Filter(
+                must=[
+                    FieldCondition(
+                        key="document_id",
+                        match=MatchValue(value=document_id)
+                    )
+                ]
+            ),
+            limit=1,
+            with_payload=True,
+            with_vectors=False
+        )
+        
+        if search_results and search_results[0].score >= ANSWER_CACHE_SIMILARITY_THRESHOLD:
+            return search_results[0].payload
+        return None
+        
+    except Exception:
+        return None
+
+async def cache_semantic_answer(question: str, query_embedding: List[float], answer: str, citations: List[Citation], document_id: int):
+    """
+    Store the answer in the Qdrant answer cache keyed by the question embedding.
+    
+    Args:
+        question: The original question
+        query_embedding: Embedding of the question
+        answer: The generated answer
+        citations: List of citations
+        document_id: Document ID
+    """
+    try:
+        await get_async_qdrant().upsert(
+            collection_name=ANSWER_CACHE_COLLECTION,
+            points=[
+                PointStruct(
+                    id=answer_cache_point_id(question, document_id),
+                    vector=query_embedding,
+                    payload={
+                        "question": question,
+                        "answer": answer,
+                        "citations": CITATIONS_ADAPTER.dump_python(citations),
+                        "document_id": document_id,
+                        "cached_at": int(time.time())
+                    }
+                )
+            ]
+        )
+        
+    except Exception:
+        pass
+
+def cleanup_semantic_cache(ttl: int = ANSWER_CACHE_TTL):
+    """
+    Delete answer cache entries older than `ttl` seconds.
+    Qdrant has no native TTL, so this runs as a periodic Celery task.
+    """
+    qdrant.delete(
+        collection_name=ANSWER_CACHE_COLLECTION,
+        points_selector=FilterSelector(
+            filter=Filter(
+                must=[
+                    FieldCondition(
+                        key="cached_at",
+                        range=Range(lt=int(time.time()) - ttl)
+                    )
+                ]
+            )
+        )
+    )
+
+async def generate_answer_with_citations(question: str, chunks: List[ChunkHit], document_id: int, query_embedding: Optional[List[float]] = None) -> Tuple[str, List[Citation]]:
     """
     Generate an answer using GPT-4o-mini and extract citations with exact text quotes.
-    Includes caching for consistent responses.
+    The answer is cached for consistent responses; /ask checks the caches
+    before searching, so this always calls the LLM.
     
     Args:
         question: The user's question
         chunks: List of relevant chunks from vector search
         document_id: Document ID for caching
+        query_embedding: Question embedding; when given, the answer is also stored in the semantic cache
         
     Returns:
         Tuple of (answer, citations)
     """
-    # Cache check is now handled at the endpoint level for efficiency
     # Prepare context from chunks
     context_parts = []
     citations = []
     
     for i, chunk in enumerate(chunks):
-        context_parts.append(f"[Context {i+1}]\n{chunk['text']}")
+        context_parts.append(f"[Context {i+1}]\n{chunk.text}")
         
         # Create search pages list (start with page_start, add page_end if different)
-        search_pages = [chunk['page_start']]
-        if chunk['page_end'] != chunk['page_start']:
-            search_pages.append(chunk['page_end'])
+        search_pages = [chunk.page_start]
+        if chunk.page_end != chunk.page_start:
+            search_pages.append(chunk.page_end)
         
         # Create citation for this chunk
         citation = Citation(
-            text=chunk['text'][:200] + "..." if len(chunk['text']) > 200 else chunk['text'],
-            page_start=chunk['page_start'],
-            page_end=chunk['page_end'],
-            chunk_id=chunk['chunk_id'],
+            text=chunk.text[:200] + "..." if len(chunk.text) > 200 else chunk.text,
+            page_start=chunk.page_start,
+            page_end=chunk.page_end,
+            chunk_id=chunk.chunk_id,
             exact_text="",  # Will be filled by LLM response parsing
             search_pages=search_pages
         )
@@ -163,9 +289,7 @@ CITATIONS:
 Answer:"""
 
     try:
-        client = OpenAI(api_key=settings.openai_api_key)
-        
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that answers questions based on provided context. Always be accurate and cite specific information when possible. Follow the exact format requested."},
@@ -185,8 +309,12 @@ Answer:"""
             if i < len(citations):
                 citations[i].exact_text = quote
         
-        # Cache the answer for future use
-        cache_answer(question, answer, citations, document_id)
+        # Cache the answer for future use, unless it was retrieved with the
+        # zero-vector fallback embedding rather than the question's own
+        if query_embedding is None or not is_fallback_embedding(query_embedding):
+            await cache_answer(question, answer, citations, document_id)
+            if query_embedding is not None:
+                await cache_semantic_answer(question, query_embedding, answer, citations, document_id)
         
         return answer, citations
         
@@ -204,26 +332,18 @@ def parse_llm_response(response_text: str) -> Tuple[str, List[str]]:
         Tuple of (answer, list_of_exact_quotes)
     """
     try:
-        # Split by ANSWER: and CITATIONS: sections
-        if "ANSWER:" in response_text and "CITATIONS:" in response_text:
-            parts = response_text.split("CITATIONS:")
-            answer_part = parts[0].replace("ANSWER:", "").strip()
-            citations_part = parts[1].strip() if len(parts) > 1 else ""
-            
-            # Extract exact quotes (one per line)
-            exact_quotes = []
-            for line in citations_part.split('\n'):
-                line = line.strip()
-                if line and not line.startswith('#'):  # Skip empty lines and comments
-                    # Remove quotes if present
-                    quote = line.strip('"').strip("'").strip()
-                    if quote:
-                        exact_quotes.append(quote)
-            
-            return answer_part, exact_quotes
-        else:
+        match = _RESPONSE_RE.search(response_text)
+        if not match:
             # Fallback: treat entire response as answer
             return response_text, []
+        
+        # Exact quotes, one per line; skip empty lines and comments, drop surrounding quotes
+        exact_quotes = [
+            quote.group(1).strip()
+            for quote in _QUOTE_LINE_RE.finditer(match.group("citations"))
+            if quote.group(1).strip()
+        ]
+        return match.group("answer"), exact_quotes
             
     except Exception as e:
         print(f"Error parsing LLM response: {str(e)}")
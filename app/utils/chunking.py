@@ -1,94 +1,102 @@
 import tiktoken
+import numpy as np
+import os
 import re
+from bisect import bisect_left, bisect_right
+from itertools import chain
 from typing import List, Dict
 
+# Shared encoder; building BPE state per call is wasted work
+_ENCODING = tiktoken.get_encoding("cl100k_base")
+
+# [PAGE:N] markers inserted at extraction, and sentence-ending punctuation
+_PAGE_MARKER_RE = re.compile(r'\[PAGE:(\d+)\]')
+_SENTENCE_END_RE = re.compile(r'[.!?]\s+')
+
 def smart_chunk_document(text: str, chunk_size: int = 900, overlap: int = 150) -> List[Dict]:
     """
     Main chunking function that takes text with inline page markers and creates chunks.
-    
+
     Input: Text with [PAGE:N] markers like "[PAGE:1] First page content [PAGE:2] Second page content"
     Output: List of chunks with accurate page tracking
+
+    The document is tokenized once; chunks are token windows whose ends are
+    snapped back to sentence boundaries and whose overlap starts on a sentence
+    boundary when one is available.
     """
     if not text.strip():
         return []
-    
-    encoding = tiktoken.get_encoding("cl100k_base")
-    
-    # Split text into sentences, preserving page markers
-    sentences = re.split(r'(?<=[.!?])\s+|(?=\[PAGE:\d+\])', text)
-    
+
+    # Strip page markers, remembering where each page starts in the clean text
+    parts = _PAGE_MARKER_RE.split(text)
+    clean_parts = [parts[0]]
+    page_offsets = [0]
+    page_numbers = [1]
+    offset = len(parts[0])
+    for page_number, page_text in zip(parts[1::2], parts[2::2]):
+        page_offsets.append(offset)
+        page_numbers.append(int(page_number))
+        clean_parts.append(page_text)
+        offset += len(page_text)
+    clean_text = "".join(clean_parts)
+
+    # Tokenize the whole document once, pages in parallel (tiktoken releases
+    # the GIL in its batch API); token_offsets[i] is the character offset in
+    # clean_text where token i starts
+    token_lists = _ENCODING.encode_ordinary_batch(clean_parts, num_threads=os.cpu_count() or 1)
+    tokens = list(chain.from_iterable(token_lists))
+    if not tokens:
+        return []
+    _, token_offsets = _ENCODING.decode_with_offsets(tokens)
+    token_offsets.append(len(clean_text))
+
+    # Token indices at which a new sentence starts: the token containing the
+    # first character after each sentence end. cl100k folds the preceding space
+    # into that token (" Gamma"), so it starts before the character and is found
+    # with a right-side searchsorted minus one, all boundaries in one call
+    sentence_ends = np.fromiter(
+        (match.end() for match in _SENTENCE_END_RE.finditer(clean_text)),
+        dtype=np.int64
+    )
+    sentence_starts = np.unique(
+        np.searchsorted(np.asarray(token_offsets[:len(tokens)]), sentence_ends, side='right') - 1
+    ).tolist()
+
+    def page_at(char_offset: int) -> int:
+        return page_numbers[bisect_right(page_offsets, char_offset) - 1]
+
     chunks = []
-    current_chunk = ""
-    current_tokens = 0
-    chunk_id = 0
-    current_page = 1
-    pages_in_chunk = set()
-    
-    for sentence in sentences:
-        # Check if this sentence is a page marker
-        page_match = re.match(r'\[PAGE:(\d+)\]', sentence.strip())
-        if page_match:
-            current_page = int(page_match.group(1))
-            continue
-        
-        # Skip empty sentences
-        if not sentence.strip():
-            continue
-            
-        sentence_tokens = len(encoding.encode(sentence))
-        
-        # If adding this sentence would exceed chunk size and we have content
-        if current_tokens + sentence_tokens > chunk_size and current_chunk.strip():
-            # Create chunk from current content
-            chunk_data = {
-                "id": chunk_id,
-                "text": current_chunk.strip(),
-                "token_count": current_tokens,
-                "page_start": min(pages_in_chunk) if pages_in_chunk else current_page,
-                "page_end": max(pages_in_chunk) if pages_in_chunk else current_page
-            }
-            chunks.append(chunk_data)
-            
-            # Start new chunk with overlap
-            overlap_text = get_overlap_text(current_chunk, overlap, encoding)
-            current_chunk = overlap_text + " " + sentence if overlap_text else sentence
-            current_tokens = len(encoding.encode(current_chunk))
-            
-            # Reset page tracking for new chunk
-            pages_in_chunk = {current_page}
-            chunk_id += 1
-        else:
-            # Add sentence to current chunk
-            if current_chunk:
-                current_chunk += " " + sentence
-                current_tokens += sentence_tokens
-            else:
-                current_chunk = sentence
-                current_tokens = sentence_tokens
-            
-            # Track which pages this chunk spans
-            pages_in_chunk.add(current_page)
-    
-    # Add final chunk
-    if current_chunk.strip():
-        chunk_data = {
-            "id": chunk_id,
-            "text": current_chunk.strip(),
-            "token_count": current_tokens,
-            "page_start": min(pages_in_chunk) if pages_in_chunk else current_page,
-            "page_end": max(pages_in_chunk) if pages_in_chunk else current_page
-        }
-        chunks.append(chunk_data)
-    
-    return chunks
+    start = 0
+    total_tokens = len(tokens)
 
-def get_overlap_text(text: str, overlap_tokens: int, encoding) -> str:
-    """
-    Get the last N tokens of text for overlap between chunks
-    """
-    tokens = encoding.encode(text)
-    if len(tokens) <= overlap_tokens:
-        return text
-    
-    overlap_tokens_list = tokens[-overlap_tokens:]
-    return encoding.decode(overlap_tokens_list)
\ No newline at end of file
+    while start < total_tokens:
+        end = min(start + chunk_size, total_tokens)
+
+        # Snap the end back to the last sentence boundary inside the window
+        if end < total_tokens:
+            i = bisect_right(sentence_starts, end) - 1
+            if i >= 0 and sentence_starts[i] > start + overlap:
+                end = sentence_starts[i]
+
+        chunk_text = clean_text[token_offsets[start]:token_offsets[end]].strip()
+        if chunk_text:
+            chunks.append({
+                "id": len(chunks),
+                "text": chunk_text,
+                "token_count": end - start,
+                "page_start": page_at(token_offsets[start]),
+                "page_end": page_at(token_offsets[end - 1])
+            })
+
+        if end >= total_tokens:
+            break
+
+        # Start the next chunk with up to `overlap` tokens of this one,
+        # beginning at a sentence start when there is one in range
+        next_start = max(end - overlap, start + 1)
+        j = bisect_left(sentence_starts, next_start)
+        if j < len(sentence_starts) and sentence_starts[j] < end:
+            next_start = sentence_starts[j]
+        start = next_start
+
+    return chunks
@@ -1,28 +1,201 @@
 import openai
+from openai import AsyncOpenAI
 from app.config import settings
+import asyncio
 import json
-from typing import List
+import numpy as np
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 
 # Set OpenAI API key
 openai.api_key = settings.openai_api_key
 
-def generate_embeddings(texts: List[str]) -> List[List[float]]:
+# Shared async client for the API's event loop
+async_client = AsyncOpenAI(api_key=settings.openai_api_key)
+
+async def _generate_embeddings_concurrently(texts: List[str], batch_size: int, concurrency: int) -> np.ndarray:
     """
-    Generate embeddings for a list of texts
+    Embed texts in batches of `batch_size`, with at most `concurrency` requests
+    in flight. Results are returned in input order.
     """
+    # Created per call: the async client is bound to the event loop that asyncio.run makes
+    client = AsyncOpenAI(api_key=settings.openai_api_key)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def embed_batch(batch: List[str]) -> np.ndarray:
+        async with semaphore:
+            response = await client.embeddings.create(
+                model=settings.embedding_model,
+                input=batch
+            )
+            return np.asarray([embedding.embedding for embedding in response.data], dtype=np.float32)
+
     try:
+        batches = await asyncio.gather(*[
+            embed_batch(texts[i:i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ])
+    finally:
+        await client.close()
+
+    return np.concatenate(batches)
+
+def generate_embeddings(texts: List[str]) -> np.ndarray:
+    """
+    Generate embeddings for a list of texts.
+    Inputs larger than settings.embedding_batch_size are split into batches
+    that are sent concurrently.
+    
+    Returns a float32 array of shape (len(texts), 1536): 4 bytes per value
+    instead of a boxed Python float per value.
+    """
+    try:
+        if len(texts) > settings.embedding_batch_size:
+            return asyncio.run(_generate_embeddings_concurrently(
+                texts,
+                batch_size=settings.embedding_batch_size,
+                concurrency=settings.embedding_concurrency
+            ))
+
         response = openai.embeddings.create(
             model=settings.embedding_model,
             input=texts
         )
-        return [embedding.embedding for embedding in response.data]
+        return np.asarray([embedding.embedding for embedding in response.data], dtype=np.float32)
     except Exception as e:
         print(f"Error generating embeddings: {e}")
         # Return dummy embeddings for testing
-        return [[0.0] * 1536 for _ in texts]
+        return np.zeros((len(texts), 1536), dtype=np.float32)
+
+# Per-process cache of question embeddings; ~6 KB each as float32
+SINGLE_EMBEDDING_CACHE_SIZE = 1024
+
+# Concurrent single-text requests are coalesced into one API call: a batch is
+# sent when it is full or when the first request in it has waited this long
+COALESCE_MAX_BATCH_SIZE = 64
+COALESCE_MAX_WAIT = 0.01  # seconds
 
-def generate_single_embedding(text: str) -> List[float]:
+class EmbeddingCache:
     """
-    Generate embedding for a single text
+    Small thread-safe LRU of text -> read-only float32 embedding for the
+    single-text path. Only successful embeddings are stored.
     """
-    return generate_embeddings([text])[0]
\ No newline at end of file
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._entries.get(text)
+            if embedding is not None:
+                self._entries.move_to_end(text)
+            return embedding
+
+    def put(self, text: str, embedding: np.ndarray):
+        embedding.flags.writeable = False
+        with self._lock:
+            self._entries[text] = embedding
+            self._entries.move_to_end(text)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+_single_embedding_cache = EmbeddingCache(SINGLE_EMBEDDING_CACHE_SIZE)
+
+class EmbeddingBatcher:
+    """
+    Dynamic batching for concurrent requests on one event loop: callers await
+    embed(text), and texts arriving within COALESCE_MAX_WAIT of each other are
+    sent to OpenAI as a single embeddings request.
+    """
+    def __init__(self, max_batch_size: int = COALESCE_MAX_BATCH_SIZE, max_wait: float = COALESCE_MAX_WAIT):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle = None
+        # Strong references so in-flight sends aren't garbage collected
+        self._sending = set()
+
+    async def embed(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            response = await async_client.embeddings.create(
+                model=settings.embedding_model,
+                input=[text for text, _ in batch]
+            )
+            for (_, future), embedding in zip(batch, response.data):
+                if not future.done():
+                    future.set_result(np.asarray(embedding.embedding, dtype=np.float32))
+        except Exception as e:
+            if len(batch) > 1:
+                # One bad input fails the whole request; retry each text on its
+                # own so only the callers whose text fails see an error
+                await asyncio.gather(*[self._send([item]) for item in batch])
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+_embedding_batcher = EmbeddingBatcher()
+
+def is_fallback_embedding(embedding: List[float]) -> bool:
+    """
+    True for the all-zero vector returned when embedding fails
+    """
+    return not any(embedding)
+
+async def generate_embeddings_async(texts: List[str]) -> np.ndarray:
+    """
+    Async variant of generate_embeddings for request handlers. Sends a single
+    request, so it is meant for a handful of texts (e.g. sub-questions).
+    """
+    try:
+        response = await async_client.embeddings.create(
+            model=settings.embedding_model,
+            input=texts
+        )
+        return np.asarray([embedding.embedding for embedding in response.data], dtype=np.float32)
+    except Exception as e:
+        print(f"Error generating embeddings: {e}")
+        # Return dummy embeddings for testing
+        return np.zeros((len(texts), 1536), dtype=np.float32)
+
+async def generate_single_embedding_async(text: str) -> List[float]:
+    """
+    Generate the embedding for a single text (e.g. a question), as a plain
+    list: it is sent to Qdrant as a query vector and stored in answer cache
+    points. Repeated texts are served from an in-process LRU cache; misses go
+    through the shared EmbeddingBatcher, so concurrent requests share one
+    API call.
+    """
+    cached = _single_embedding_cache.get(text)
+    if cached is not None:
+        return cached.tolist()
+    try:
+        embedding = await _embedding_batcher.embed(text)
+        _single_embedding_cache.put(text, embedding)
+        return embedding.tolist()
+    except Exception as e:
+        print(f"Error generating embeddings: {e}")
+        # Return dummy embeddings for testing
+        return [0.0] * 1536
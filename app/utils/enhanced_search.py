@@ -3,68 +3,78 @@
 Enhanced search functionality using structured question decomposition.
 """
 
-import json
-from typing import List, Dict
-from openai import OpenAI
+import numpy as np
+import orjson
+from typing import List, Dict, Optional
+from openai import AsyncOpenAI
 from app.config import settings
-from app.utils.embeddings import generate_embeddings
-from app.utils.vector_search import search_similar_chunks
+from app.utils.embeddings import generate_embeddings_async, generate_single_embedding_async
+from app.utils.vector_search import ChunkHit, search_similar_chunks, search_similar_chunks_batch
 
-# Initialize OpenAI client
-client = OpenAI(api_key=settings.openai_api_key)
+# Reciprocal-rank fusion constant (the usual k=60 from the RRF paper)
+RRF_K = 60
 
-def split_question_structured(question: str) -> Dict:
+# Question-splitting request pieces, built once at import; only the user
+# message is created per question
+SPLIT_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are an expert at analyzing questions and breaking them down into essential components. Analyze the given question and break it down into the most essential sub-questions needed to provide a complete answer. Focus on distinct aspects that require separate consideration."
+}
+
+SPLIT_FUNCTIONS = [
+    {
+        "name": "analyze_question_complexity",
+        "description": "Analyze question complexity and extract essential sub-questions",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "complexity": {
+                    "type": "string",
+                    "enum": ["simple", "medium", "complex"],
+                    "description": "Question complexity level"
+                },
+                "sub_questions": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Essential sub-questions needed to answer the original question"
+                },
+                "reasoning": {
+                    "type": "string", 
+                    "description": "Brief explanation of why these sub-questions were selected"
+                }
+            },
+            "required": ["complexity", "sub_questions", "reasoning"]
+        }
+    }
+]
+
+SPLIT_FUNCTION_CALL = {"name": "analyze_question_complexity"}
+
+# Initialize OpenAI client (async: called from the /ask event loop)
+client = AsyncOpenAI(api_key=settings.openai_api_key)
+
+async def split_question_structured(question: str) -> Dict:
     """
     Use OpenAI function calling to parse a legal question into structured data.
     Returns complexity analysis and essential sub-questions.
     """
-    functions = [
-        {
-            "name": "analyze_question_complexity",
-            "description": "Analyze question complexity and extract essential sub-questions",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "complexity": {
-                        "type": "string",
-                        "enum": ["simple", "medium", "complex"],
-                        "description": "Question complexity level"
-                    },
-                    "sub_questions": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Essential sub-questions needed to answer the original question"
-                    },
-                    "reasoning": {
-                        "type": "string", 
-                        "description": "Brief explanation of why these sub-questions were selected"
-                    }
-                },
-                "required": ["complexity", "sub_questions", "reasoning"]
-            }
-        }
-    ]
-    
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
-                {
-                    "role": "system", 
-                    "content": "You are an expert at analyzing questions and breaking them down into essential components. Analyze the given question and break it down into the most essential sub-questions needed to provide a complete answer. Focus on distinct aspects that require separate consideration."
-                },
+                SPLIT_SYSTEM_MESSAGE,
                 {
                     "role": "user", 
                     "content": f"Analyze this question: '{question}'"
                 }
             ],
-            functions=functions,
-            function_call={"name": "analyze_question_complexity"}
+            functions=SPLIT_FUNCTIONS,
+            function_call=SPLIT_FUNCTION_CALL
         )
         
         function_call = response.choices[0].message.function_call
         if function_call and function_call.name == "analyze_question_complexity":
-            arguments = json.loads(function_call.arguments)
+            arguments = orjson.loads(function_call.arguments)
             return arguments
         else:
             return {"error": "No function call returned"}
@@ -72,40 +82,69 @@ def split_question_structured(question: str) -> Dict:
     except Exception as e:
         return {"error": f"OpenAI API error: {str(e)}"}
 
-def deduplicate_chunks(chunks: List[Dict]) -> List[Dict]:
+def deduplicate_chunks(chunks: List[ChunkHit]) -> List[ChunkHit]:
     """
-    Remove duplicate chunks based on chunk_id while preserving order.
+    Remove duplicate chunks based on chunk_id, keeping the copy with the
+    highest similarity score. First-seen order is preserved.
     """
-    seen_ids = set()
-    unique_chunks = []
+    best = {}
     
     for chunk in chunks:
-        chunk_id = chunk.get('chunk_id')
-        if chunk_id not in seen_ids:
-            seen_ids.add(chunk_id)
-            unique_chunks.append(chunk)
+        chunk_id = chunk.chunk_id
+        if chunk_id not in best or chunk.similarity_score > best[chunk_id].similarity_score:
+            best[chunk_id] = chunk
+    
+    return list(best.values())
+
+def fuse_ranked_results(result_lists: List[List[ChunkHit]], unique_chunks: List[ChunkHit], top_n: int = 8) -> List[ChunkHit]:
+    """
+    Rank deduplicated chunks by reciprocal-rank fusion across the per-sub-question
+    result lists: score = sum over lists of 1 / (RRF_K + rank), so a chunk that
+    several sub-questions retrieve outranks one that a single sub-question scored
+    slightly higher. Ties fall back to the best similarity score.
+    """
+    index = {chunk.chunk_id: i for i, chunk in enumerate(unique_chunks)}
     
-    return unique_chunks
+    # (n_chunks x n_lists) rank matrix; inf where a list didn't return the chunk
+    ranks = np.full((len(unique_chunks), len(result_lists)), np.inf)
+    for j, results in enumerate(result_lists):
+        for rank, chunk in enumerate(results):
+            ranks[index[chunk.chunk_id], j] = rank
+    
+    rrf_scores = (1.0 / (RRF_K + ranks)).sum(axis=1)
+    similarity = np.array([chunk.similarity_score for chunk in unique_chunks])
+    
+    # lexsort: last key is primary
+    order = np.lexsort((-similarity, -rrf_scores))[:top_n]
+    return [unique_chunks[i] for i in order]
 
-def enhanced_search(question: str, document_id: int) -> List[Dict]:
+async def enhanced_search(question: str, document_id: int, query_embedding: Optional[List[float]] = None) -> List[ChunkHit]:
     """
     Enhanced search using structured question decomposition.
     
     Args:
         question: The user's question
         document_id: Document ID to search within
+        query_embedding: Precomputed embedding of the question, reused for the
+            simple-search fallback instead of embedding the question again
     
     Returns:
         List of relevant chunks with deduplication
     """
+    async def question_embedding() -> List[float]:
+        nonlocal query_embedding
+        if query_embedding is None:
+            query_embedding = await generate_single_embedding_async(question)
+        return query_embedding
+    
     try:
         # 1. Parse question into structured sub-questions
-        parsed = split_question_structured(question)
+        parsed = await split_question_structured(question)
         
         if "error" in parsed:
             # Fallback to simple search
-            return search_similar_chunks(
-                generate_embeddings([question])[0],
+            return await search_similar_chunks(
+                await question_embedding(),
                 top_k=8,
                 document_id=document_id
             )
@@ -119,55 +158,50 @@ def enhanced_search(question: str, document_id: int) -> List[Dict]:
         if len(sub_questions) > max_sub_questions:
             sub_questions = sub_questions[:max_sub_questions]
         
-        for sub_q in sub_questions:
-            try:
-                # Generate embedding for sub-question
-                sub_embedding = generate_embeddings([sub_q])[0]
-                
-                # Search with small top_k per sub-question
-                chunks = search_similar_chunks(
-                    sub_embedding,
-                    top_k=3,  # Increased for better coverage per sub-question
-                    document_id=document_id
-                )
-                all_chunks.extend(chunks)
-                
-            except Exception as e:
-                continue
+        # Embed all sub-questions in a single API call
+        # Qdrant's SearchRequest model takes plain float lists
+        sub_embeddings = (await generate_embeddings_async(sub_questions)).tolist() if sub_questions else []
+        
+        # Search all sub-questions in a single Qdrant request, small top_k each
+        result_lists = await search_similar_chunks_batch(
+            sub_embeddings,
+            top_k=3,  # Increased for better coverage per sub-question
+            document_id=document_id
+        )
+        for chunks in result_lists:
+            all_chunks.extend(chunks)
         
         # 3. Deduplicate and return top chunks
         unique_chunks = deduplicate_chunks(all_chunks)
         
-        # Sort by similarity score and return top-8
-        unique_chunks.sort(key=lambda x: x.get('similarity_score', 0), reverse=True)
-        
         # Ensure we have enough chunks, fallback to simple search if needed
         if len(unique_chunks) < 3:
-            return search_similar_chunks(
-                generate_embeddings([question])[0],
+            return await search_similar_chunks(
+                await question_embedding(),
                 top_k=8,
                 document_id=document_id
             )
         
-        return unique_chunks[:8]
+        # Top-8 by fused rank across sub-questions
+        return fuse_ranked_results(result_lists, unique_chunks, top_n=8)
         
     except Exception as e:
         # Fallback to simple search
         try:
-            return search_similar_chunks(
-                generate_embeddings([question])[0],
+            return await search_similar_chunks(
+                await question_embedding(),
                 top_k=8,
                 document_id=document_id
             )
         except Exception as fallback_error:
             return []
 
-def get_search_strategy_info(question: str) -> Dict:
+async def get_search_strategy_info(question: str) -> Dict:
     """
     Get information about the search strategy that would be used for a question.
     Useful for debugging and monitoring.
     """
-    parsed = split_question_structured(question)
+    parsed = await split_question_structured(question)
     
     if "error" in parsed:
         return {
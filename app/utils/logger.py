@@ -0,0 +1,88 @@
+"""
+Application loggers writing to logs/<name>_<YYYYMMDD>.log and the console.
+
+Records are handed to a QueueHandler and written by a QueueListener thread,
+so logging calls on request paths never block on file or stdout I/O.
+"""
+
+import atexit
+import logging
+import os
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from app.config import settings
+
+LOG_DIR = Path("logs")
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+class Logger:
+    """
+    Thin wrapper around a stdlib logger that accepts structured fields:
+
+        api_logger.info("Ask request received", document_id=3)
+        -> "... - api - INFO - Ask request received document_id=3"
+
+    DEBUG records are only emitted when settings.debug is enabled.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(logging.DEBUG if settings.debug else settings.log_level.upper())
+        self.logger.propagate = False
+
+        LOG_DIR.mkdir(exist_ok=True)
+        formatter = logging.Formatter(LOG_FORMAT)
+
+        file_handler = logging.FileHandler(LOG_DIR / f"{name}_{datetime.now():%Y%m%d}.log")
+        file_handler.setFormatter(formatter)
+
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+
+        self._handlers = (file_handler, console_handler)
+        self._queue = None
+        self._listener = None
+        self._pid = None
+        self._start_listener()
+        atexit.register(self._stop_listener)
+
+    def _start_listener(self):
+        # Listener threads don't survive fork (e.g. Celery prefork workers),
+        # so each process starts its own, on a fresh queue: the parent's may
+        # still hold its records and a lock taken at fork time
+        self._queue = queue.Queue(-1)
+        self.logger.handlers = [QueueHandler(self._queue)]
+        self._listener = QueueListener(self._queue, *self._handlers, respect_handler_level=True)
+        self._listener.start()
+        self._pid = os.getpid()
+
+    def _stop_listener(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+
+    def _log(self, level: int, message: str, fields: dict):
+        if not self.logger.isEnabledFor(level):
+            return
+        if self._pid != os.getpid():
+            self._start_listener()
+        if fields:
+            message = f"{message} " + " ".join(f"{key}={value}" for key, value in fields.items())
+        self.logger.log(level, message)
+
+    def debug(self, message: str, **fields):
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message: str, **fields):
+        self._log(logging.INFO, message, fields)
+
+    def warning(self, message: str, **fields):
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message: str, **fields):
+        self._log(logging.ERROR, message, fields)
+
+api_logger = Logger("api")
+tasks_logger = Logger("tasks")
@@ -1,53 +1,45 @@
 from app.config import settings
-from app.redis_client import redis_client
+from app.redis_async import redis_async
 
-def check_rate_limit(ip_address: str, limit: int = 10, ttl: int = 300) -> dict:
+# Fixed-window counter in one round-trip: INCR, start the window on the first
+# hit, and return the count together with the remaining window in ms.
+RATE_LIMIT_LUA = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[1])
+end
+return {current, redis.call('PTTL', KEYS[1])}
+"""
+
+# Registered once; redis-py sends EVALSHA and falls back to loading the script
+rate_limit_script = redis_async.register_script(RATE_LIMIT_LUA)
+
+async def check_rate_limit(ip_address: str, limit: int = 10, ttl: int = 300) -> dict:
     """
     Check and enforce rate limiting for an IP address.
-    
+
     Args:
         ip_address: The client's IP address
-        limit: Maximum requests per time window (default: 60)
-        ttl: Time window in seconds (default: 3600 = 1 hour)
-    
+        limit: Maximum requests per time window (default: 10)
+        ttl: Time window in seconds (default: 300 = 5 minutes)
+
     Returns:
         dict: {
             "allowed": bool,
             "remaining": int,
-            "reset_time": int (timestamp)
+            "reset_time": int (seconds until the window resets)
         }
     """
     key = f"rate_limit:{ip_address}"
-    
-    # Lua script for atomic rate limiting
-    lua_script = """
-    local key = KEYS[1]
-    local limit = tonumber(ARGV[1])
-    local ttl = tonumber(ARGV[2])
-    
-    local current = redis.call('GET', key)
-    if current == false then
-        redis.call('SETEX', key, ttl, limit - 1)
-        return {limit - 1, 1}  -- {remaining, allowed}
-    else
-        local count = tonumber(current)
-        if count > 0 then
-            redis.call('DECR', key)
-            return {count - 1, 1}  -- {remaining, allowed}
-        else
-            return {0, 0}  -- {remaining, denied}
-        end
-    end
-    """
-    
+
     try:
-        result = redis_client.eval(lua_script, 1, key, limit, ttl)
-        remaining, allowed = result
-        
+        current, ttl_ms = await rate_limit_script(keys=[key], args=[ttl * 1000])
+        current = int(current)
+
         return {
-            "allowed": bool(allowed),
-            "remaining": int(remaining),
-            "reset_time": int(redis_client.ttl(key))
+            "allowed": current <= limit,
+            "remaining": max(limit - current, 0),
+            "reset_time": max((int(ttl_ms) + 999) // 1000, 0)
         }
     except Exception as e:
         print(f"Rate limiting error: {e}")
@@ -56,4 +48,4 @@ def check_rate_limit(ip_address: str, limit: int = 10, ttl: int = 300) -> dict:
             "allowed": True,
             "remaining": limit - 1,
             "reset_time": 0
-        }
\ No newline at end of file
+        }
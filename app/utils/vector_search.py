@@ -1,21 +1,131 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
+from qdrant_client.models import Filter, FieldCondition, MatchValue, SearchParams, QuantizationSearchParams, SearchRequest
 from app.database import SessionLocal
+from app.vector_db import get_async_qdrant
 from app.models.models import Chunk
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, NamedTuple
+import asyncio
 import json
 
-def search_similar_chunks(query_embedding: List[float], top_k: int = 6, document_id: int = None) -> List[Dict]:
+# Search the binary-quantized index, then rescore 2x candidates with full vectors.
+# hnsw_ef trades recall for latency at query time.
+SEARCH_PARAMS = SearchParams(
+    hnsw_ef=128,
+    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+
+class ChunkHit(NamedTuple):
+    """
+    One search result: a chunk and its similarity to the query
+    """
+    chunk_id: int
+    similarity_score: float  # Cosine similarity (higher is more similar)
+    text: str  # Chunk text (for LLM input)
+    page_start: int  # For citations
+    page_end: int
+    token_count: int  # For cost tracking
+
+def document_filter(document_id: Optional[int]) -> Optional[Filter]:
+    """
+    Build the Qdrant filter restricting a search to one document (None = no filter)
+    """
+    if document_id is None:
+        return None
+    return Filter(
+        must=[
+            FieldCondition(
+                key="document_id",
+                match=MatchValue(value=document_id)
+            )
+        ]
+    )
+
+def fetch_chunk_rows(db, chunk_ids: List[int]) -> Dict:
+    """
+    Fetch only the essential chunk fields from PostgreSQL in a single IN (...) query.
+
+    Returns:
+        Dict mapping chunk id -> row
+    """
+    if not chunk_ids:
+        return {}
+    rows = db.query(Chunk.id, Chunk.text, Chunk.page_start, Chunk.page_end, Chunk.token_count).filter(Chunk.id.in_(chunk_ids)).all()
+    return {row.id: row for row in rows}
+
+def attach_chunk_data(chunk_rows: Dict, search_results) -> List[ChunkHit]:
+    """
+    Build ChunkHits from Qdrant hits, preserving score order. Chunk fields
+    come from the point payload; chunk_rows covers points stored before the
+    payload carried them.
+    """
+    results = []
+    for result in search_results:
+        chunk_id = result.id
+        similarity_score = result.score
+        payload = result.payload or {}
+
+        if "text" in payload:
+            results.append(ChunkHit(
+                chunk_id=chunk_id,
+                similarity_score=similarity_score,
+                text=payload["text"],
+                page_start=payload["page_start"],
+                page_end=payload["page_end"],
+                token_count=payload["token_count"]
+            ))
+            continue
+
+        chunk = chunk_rows.get(chunk_id)
+
+        if chunk:
+            results.append(ChunkHit(
+                chunk_id=chunk_id,
+                similarity_score=similarity_score,
+                text=chunk.text,
+                page_start=chunk.page_start,
+                page_end=chunk.page_end,
+                token_count=chunk.token_count
+            ))
+    return results
+
+def load_chunk_rows(chunk_ids: List[int]) -> Dict:
+    """
+    Open a session and fetch chunk rows (see fetch_chunk_rows)
+    """
+    db = SessionLocal()
+    try:
+        return fetch_chunk_rows(db, chunk_ids)
+    finally:
+        db.close()
+
+async def build_search_results(batch_results) -> List[List[ChunkHit]]:
+    """
+    Turn one or more Qdrant result sets into chunk result lists. Postgres is
+    only queried (once, with IN, in a worker thread) for hits whose payload
+    lacks the chunk text.
+    """
+    missing_ids = list({
+        result.id
+        for search_results in batch_results
+        for result in search_results
+        if "text" not in (result.payload or {})
+    })
+
+    chunk_rows = {}
+    if missing_ids:
+        chunk_rows = await asyncio.to_thread(load_chunk_rows, missing_ids)
+    return [attach_chunk_data(chunk_rows, search_results) for search_results in batch_results]
+
+async def search_similar_chunks(query_embedding: List[float], top_k: int = 6, document_id: int = None) -> List[ChunkHit]:
     """
     Search for similar chunks using vector similarity in Qdrant.
-    
+
     Args:
         query_embedding: The query vector (1536 dimensions for OpenAI embeddings)
         top_k: Number of top similar chunks to retrieve
         document_id: Document ID to filter results (required for document-specific search)
-    
+
     Returns:
-        List of dictionaries containing:
+        List of ChunkHit tuples with:
         - chunk_id: The chunk ID from database
         - similarity_score: Cosine similarity score (0-1, higher is more similar)
         - text: The chunk text content (for LLM input)
@@ -24,56 +134,56 @@ def search_similar_chunks(query_embedding: List[float], top_k: int = 6, document
         - token_count: Number of tokens in the chunk (for cost tracking)
     """
     try:
-        # Connect to Qdrant
-        qdrant_client = QdrantClient(host="127.0.0.1", port=6333)
-        
-        # Prepare search parameters
-        search_params = {
-            "collection_name": "embeddings",
-            "query_vector": query_embedding,
-            "limit": top_k,
-            "with_payload": True,  # Include metadata (chunk_id, document_id)
-            "with_vectors": False  # Don't return vectors (we have them in query)
-        }
-        
-        # Add document filter if specified
-        if document_id is not None:
-            search_params["query_filter"] = Filter(
-                must=[
-                    FieldCondition(
-                        key="document_id",
-                        match=MatchValue(value=document_id)
-                    )
-                ]
-            )
-        
         # Perform vector search in Qdrant
-        search_results = qdrant_client.search(**search_params)
-        
-        # Get database session to fetch only needed chunk data
-        db = SessionLocal()
-        
-        results = []
-        for result in search_results:
-            chunk_id = result.id
-            similarity_score = result.score
-            
-            # Get only the essential fields from PostgreSQL
-            chunk = db.query(Chunk.text, Chunk.page_start, Chunk.page_end, Chunk.token_count).filter(Chunk.id == chunk_id).first()
-            
-            if chunk:
-                results.append({
-                    "chunk_id": chunk_id,
-                    "similarity_score": similarity_score,
-                    "text": chunk.text,
-                    "page_start": chunk.page_start,
-                    "page_end": chunk.page_end,
-                    "token_count": chunk.token_count
-                })
-        
-        db.close()
-        return results
-        
+        search_results = await get_async_qdrant().search(
+            collection_name="embeddings",
+            query_vector=query_embedding,
+            query_filter=document_filter(document_id),
+            limit=top_k,
+            with_payload=True,  # Chunk text, pages and token count travel with the hit
+            with_vectors=False,  # Don't return vectors (we have them in query)
+            search_params=SEARCH_PARAMS
+        )
+
+        return (await build_search_results([search_results]))[0]
+
     except Exception as e:
         print(f"Vector search error: {e}")
         return []
+
+async def search_similar_chunks_batch(query_embeddings: List[List[float]], top_k: int = 6, document_id: int = None) -> List[List[ChunkHit]]:
+    """
+    Run several vector searches in a single Qdrant request (search_batch).
+
+    Args:
+        query_embeddings: One query vector per search
+        top_k: Number of top similar chunks to retrieve per query
+        document_id: Document ID to filter results
+
+    Returns:
+        One result list per query embedding, in the same order and format
+        as search_similar_chunks
+    """
+    if not query_embeddings:
+        return []
+
+    try:
+        query_filter = document_filter(document_id)
+        requests = [
+            SearchRequest(
+                vector=query_embedding,
+                filter=query_filter,
+                limit=top_k,
+                with_payload=True,
+                with_vector=False,
+                params=SEARCH_PARAMS
+            )
+            for query_embedding in query_embeddings
+        ]
+
+        batch_results = await get_async_qdrant().search_batch(collection_name="embeddings", requests=requests)
+        return await build_search_results(batch_results)
+
+    except Exception as e:
+        print(f"Vector search error: {e}")
+        return [[] for _ in query_embeddings]
@@ -0,0 +1,19 @@
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from app.config import settings
+from functools import lru_cache
+import logging
+
+# The client and its HTTP transport log every request at DEBUG/INFO
+logging.getLogger("qdrant_client").setLevel(logging.WARNING)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Shared client: gRPC for point/search traffic, connection reused across requests
+qdrant = QdrantClient(host=settings.qdrant_host, port=settings.qdrant_port, grpc_port=settings.qdrant_grpc_port, prefer_grpc=True)
+
+@lru_cache(maxsize=1)
+def get_async_qdrant() -> AsyncQdrantClient:
+    """
+    Shared async client for the API's event loop. Created on first use rather
+    than at import, because its gRPC channel binds to the running loop.
+    """
+    return AsyncQdrantClient(host=settings.qdrant_host, port=settings.qdrant_port, grpc_port=settings.qdrant_grpc_port, prefer_grpc=True)
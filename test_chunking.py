@@ -0,0 +1,29 @@
+from app.utils.chunking import smart_chunk_document
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa".split()
+
+def make_text() -> str:
+    # Sentences of 3-6 words with mixed end punctuation, over two pages
+    sentences = [
+        " ".join(WORDS[(i + j) % len(WORDS)] for j in range(3 + i % 4)).capitalize() + "!?."[i % 3]
+        for i in range(80)
+    ]
+    return "[PAGE:1] " + " ".join(sentences[:40]) + "\n\n[PAGE:2] " + " ".join(sentences[40:])
+
+def test_chunks_snap_to_sentences():
+    # Real cl100k tokens: the space after a sentence end belongs to the next
+    # sentence's first token (" Gamma"), which is where boundaries must land
+    chunks = smart_chunk_document(make_text(), chunk_size=40, overlap=12)
+    assert len(chunks) > 1
+
+    for chunk in chunks:
+        # Every snapped chunk ends on its own sentence's punctuation...
+        assert chunk["text"][-1] in ".!?", chunk["text"]
+    for chunk in chunks[1:]:
+        # ...and every overlap starts at the beginning of a sentence
+        assert chunk["text"][0].isupper(), chunk["text"]
+
+    print(f"✅ {len(chunks)} chunks, all aligned to sentence boundaries")
+
+if __name__ == "__main__":
+    test_chunks_snap_to_sentences()
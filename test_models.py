@@ -1,30 +1,35 @@
 from app.database import engine
-from app.models.models import Document, Chunk, Embedding, Base
+from app.models.models import Document, Chunk, Base
+from sqlalchemy import insert
 
-def test_models():
+def test_models(n: int = 1):
     try:
         # Create all tables
         Base.metadata.create_all(bind=engine)
         print("✅ Tables created successfully!")
         
-        # Test creating a document
+        # Test creating documents
         from app.database import SessionLocal
-        db = SessionLocal()
         
-        # Create a test document
-        test_doc = Document(
-            content_hash="test_hash_123",
-            title="Test Document",
-            pages=5,
-            bytes=10000,
-            status="ready"
-        )
+        # Test documents: the first keeps the original hash, extras get a suffix
+        rows = [
+            {
+                "content_hash": "test_hash_123" if i == 0 else f"test_hash_123_{i}",
+                "title": "Test Document" if i == 0 else f"Test Document {i}",
+                "pages": 5,
+                "bytes": 10000,
+                "status": "ready"
+            }
+            for i in range(n)
+        ]
         
-        db.add(test_doc)
-        db.commit()
-        print(f"✅ Document created with ID: {test_doc.id}")
+        # One multi-row INSERT and a single commit, however many documents
+        with SessionLocal.begin() as db:
+            doc_ids = db.scalars(insert(Document).returning(Document.id), rows).all()
+        print(f"✅ {len(doc_ids)} document(s) created, first ID: {doc_ids[0]}")
         
         # Test querying
+        db = SessionLocal()
         found_doc = db.query(Document).filter(Document.content_hash == "test_hash_123").first()
         print(f"✅ Found document: {found_doc.title}")
         
@@ -4,74 +4,224 @@ Test script to evaluate OpenAI's ability to parse complex legal questions
 into structured data for enhanced search strategies.
 """
 
+import io
 import os
-import json
-from openai import OpenAI
+import sys
+import orjson
+import asyncio
+import hashlib
+import re
+import shelve
+from contextlib import contextmanager, redirect_stdout
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
 from typing import List, Dict
 from app.config import settings
 
-# Initialize OpenAI client
-client = OpenAI(api_key=settings.openai_api_key)
+# libuv-backed event loop for the test runs; uvloop comes with
+# uvicorn[standard] but isn't available everywhere (e.g. Windows)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
-def parse_question_with_functions(question: str) -> Dict:
+# Sections that cite the constitution by article or amendment
+_KEYWORD_RE = re.compile(r'Article|Amendment')
+
+# Cap on in-flight OpenAI requests when fanning out over the test questions
+MAX_CONCURRENT_REQUESTS = int(os.getenv("OAI_CONCURRENCY", "8"))
+
+# Retries for 429s, 5xx, timeouts and connection errors; the SDK backs off
+# exponentially between attempts (and honours Retry-After)
+MAX_RETRIES = 5
+
+# Per-request timeout (seconds), so one stalled call can't hold up a gather
+REQUEST_TIMEOUT = 20
+
+# System prompts and function schemas shared by every request
+ANALYZE_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are an expert at analyzing questions and breaking them down into essential components. Analyze the given question and break it down into the most essential sub-questions needed to provide a complete answer. Focus on distinct aspects that require separate consideration."
+}
+
+BASIC_SPLIT_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "Break down complex legal questions into simpler sub-questions. Return only the sub-questions, one per line, without numbering or bullets."
+}
+
+SMART_SPLIT_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "Break down this legal question into the most essential sub-questions needed to answer it completely. Focus on core concepts that must be addressed and distinct aspects that need separate consideration. Avoid redundant or overly specific questions. Return only the most relevant sub-questions, one per line, without numbering."
+}
+
+# Function schema for parsing legal questions
+FUNCTIONS_PARSE = [
+    {
+        "name": "extract_constitutional_topics",
+        "description": "Extract constitutional topics, sections, and concepts from legal questions",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "topics": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "List of constitutional topics and concepts (e.g., 'Congress powers', 'Presidential powers', '22nd Amendment')"
+                },
+                "sections": {
+                    "type": "array", 
+                    "items": {"type": "string"},
+                    "description": "Specific constitutional sections and articles (e.g., 'Article I Section 8', 'Article II Section 2', 'Amendment XXII')"
+                },
+                "legal_concepts": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Legal concepts and terms (e.g., 'impeachment', 'commerce clause', 'due process')"
+                },
+                "question_type": {
+                    "type": "string",
+                    "description": "Type of question: 'simple', 'comparison', 'multi-part', 'complex'"
+                }
+            },
+            "required": ["topics", "sections", "legal_concepts", "question_type"]
+        }
+    }
+]
+
+PARSE_FUNCTION_CALL = {"name": "extract_constitutional_topics"}
+
+# Function schema for the structured splitting approach
+FUNCTIONS_ANALYZE = [
+    {
+        "name": "analyze_question_complexity",
+        "description": "Analyze question complexity and extract essential sub-questions",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "complexity": {
+                    "type": "string",
+                    "enum": ["simple", "medium", "complex"],
+                    "description": "Question complexity level"
+                },
+                "sub_questions": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Essential sub-questions needed to answer the original question"
+                },
+                "reasoning": {
+                    "type": "string", 
+                    "description": "Brief explanation of why these sub-questions were selected"
+                }
+            },
+            "required": ["complexity", "sub_questions", "reasoning"]
+        }
+    }
+]
+
+ANALYZE_FUNCTION_CALL = {"name": "analyze_question_complexity"}
+
+@contextmanager
+def buffered_output():
     """
-    Use OpenAI function calling to parse a legal question into structured data.
+    Collect the print() output of one question block and write it to stdout
+    in a single call, instead of one line-buffered write per print.
+    """
+    buf = io.StringIO()
+    try:
+        with redirect_stdout(buf):
+            yield
+    finally:
+        sys.stdout.write(buf.getvalue())
+        sys.stdout.flush()
+
+def make_client() -> AsyncOpenAI:
+    """
+    Create an OpenAI client. The async client's connection pool is bound to the
+    event loop it first runs on, so each run gets its own.
+    """
+    return AsyncOpenAI(api_key=settings.openai_api_key, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES)
+
+# Completions are cached on disk by request, so reruns of these fixed questions
+# skip the API; set OPENAI_CACHE=0 to always call OpenAI
+CACHE_PATH = ".openai_cache"
+USE_CACHE = os.getenv("OPENAI_CACHE", "1") != "0"
+
+async def cached_chat_completion(client: AsyncOpenAI, **request) -> ChatCompletion:
     """
+    client.chat.completions.create(**request), served from the disk cache
+    when the same request (model, messages, functions, ...) was made before.
+    """
+    if not USE_CACHE:
+        return await client.chat.completions.create(**request)
     
-    # Define the function schema for parsing legal questions
-    functions = [
-        {
-            "name": "extract_constitutional_topics",
-            "description": "Extract constitutional topics, sections, and concepts from legal questions",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "topics": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "List of constitutional topics and concepts (e.g., 'Congress powers', 'Presidential powers', '22nd Amendment')"
-                    },
-                    "sections": {
-                        "type": "array", 
-                        "items": {"type": "string"},
-                        "description": "Specific constitutional sections and articles (e.g., 'Article I Section 8', 'Article II Section 2', 'Amendment XXII')"
-                    },
-                    "legal_concepts": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Legal concepts and terms (e.g., 'impeachment', 'commerce clause', 'due process')"
-                    },
-                    "question_type": {
-                        "type": "string",
-                        "description": "Type of question: 'simple', 'comparison', 'multi-part', 'complex'"
-                    }
-                },
-                "required": ["topics", "sections", "legal_concepts", "question_type"]
-            }
-        }
-    ]
+    key = hashlib.sha256(orjson.dumps(request, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    with shelve.open(CACHE_PATH) as cache:
+        cached = cache.get(key)
+    if cached is not None:
+        return ChatCompletion.model_validate(cached)
+    
+    response = await client.chat.completions.create(**request)
+    with shelve.open(CACHE_PATH) as cache:
+        cache[key] = response.model_dump()
+    return response
+
+def run_on_loop(coroutine):
+    """
+    asyncio.run(coroutine), on a uvloop loop when uvloop is installed. The loop
+    is passed per run rather than installed as the global policy, so importing
+    this module (e.g. during pytest collection) changes nothing.
+    """
+    with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop else None) as runner:
+        return runner.run(coroutine)
+
+async def run_with_client(test_body):
+    """
+    Run an async test body with a fresh client, closing it afterwards.
+    """
+    client = make_client()
+    try:
+        await test_body(client)
+    finally:
+        await client.close()
+
+async def gather_bounded(coroutines, limit: int = MAX_CONCURRENT_REQUESTS) -> List:
+    """
+    asyncio.gather with at most `limit` coroutines running at once. Results
+    are returned in input order.
+    """
+    semaphore = asyncio.Semaphore(limit)
+    
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+    
+    return await asyncio.gather(*[bounded(coroutine) for coroutine in coroutines])
+
+async def parse_question_with_functions(client: AsyncOpenAI, question: str) -> Dict:
+    """
+    Use OpenAI function calling to parse a legal question into structured data.
+    """
     
     try:
-        response = client.chat.completions.create(
+        response = await cached_chat_completion(
+            client,
             model="gpt-4o-mini",
             messages=[
-                {
-                    "role": "system", 
-                    "content": "You are an expert at analyzing questions and breaking them down into essential components. Analyze the given question and break it down into the most essential sub-questions needed to provide a complete answer. Focus on distinct aspects that require separate consideration."
-                },
+                ANALYZE_SYSTEM_MESSAGE,
                 {
                     "role": "user", 
                     "content": f"Parse this legal question: '{question}'"
                 }
             ],
-            functions=functions,
-            function_call={"name": "extract_constitutional_topics"}
+            functions=FUNCTIONS_PARSE,
+            function_call=PARSE_FUNCTION_CALL,
+            max_tokens=300,
+            temperature=0
         )
         
         # Extract the function call arguments
         function_call = response.choices[0].message.function_call
         if function_call and function_call.name == "extract_constitutional_topics":
-            return json.loads(function_call.arguments)
+            return orjson.loads(function_call.arguments)
         else:
             return {"error": "No function call returned"}
             
@@ -82,6 +232,13 @@ def test_question_parsing():
     """
     Test OpenAI's question parsing ability with various complexity levels.
     """
+    run_on_loop(run_with_client(question_parsing))
+
+async def question_parsing(client: AsyncOpenAI):
+    """
+    Body of test_question_parsing: parse all questions concurrently, then
+    print the results in order.
+    """
     
     # Test questions from simple to complex
     test_questions = [
@@ -106,71 +263,71 @@ def test_question_parsing():
     print("🧪 Testing OpenAI Question Parsing")
     print("=" * 80)
     
-    for i, question in enumerate(test_questions, 1):
-        print(f"\n📝 Question {i}: {question}")
-        print("-" * 60)
-        
-        # Parse the question
-        result = parse_question_with_functions(question)
-        
-        if "error" in result:
-            print(f"❌ Error: {result['error']}")
-            continue
-        
-        # Display results
-        print(f"🎯 Question Type: {result.get('question_type', 'N/A')}")
-        
-        print(f"📚 Topics ({len(result.get('topics', []))}):")
-        for topic in result.get('topics', []):
-            print(f"   • {topic}")
-        
-        print(f"📖 Sections ({len(result.get('sections', []))}):")
-        for section in result.get('sections', []):
-            print(f"   • {section}")
-        
-        print(f"⚖️ Legal Concepts ({len(result.get('legal_concepts', []))}):")
-        for concept in result.get('legal_concepts', []):
-            print(f"   • {concept}")
-        
-        # Evaluate the parsing quality
-        topics = result.get('topics', [])
-        sections = result.get('sections', [])
-        concepts = result.get('legal_concepts', [])
-        
-        quality_score = 0
-        if topics: quality_score += 1
-        if sections: quality_score += 1  
-        if concepts: quality_score += 1
-        if len(topics) >= 2: quality_score += 1  # Multiple topics for complex questions
-        if any('Article' in s or 'Amendment' in s for s in sections): quality_score += 1
-        
-        print(f"✅ Quality Score: {quality_score}/5")
-        
-        if quality_score >= 4:
-            print("🎉 Excellent parsing!")
-        elif quality_score >= 3:
-            print("👍 Good parsing")
-        else:
-            print("⚠️ Needs improvement")
+    # Parse all questions concurrently
+    results = await gather_bounded([parse_question_with_functions(client, question) for question in test_questions])
+    
+    for i, (question, result) in enumerate(zip(test_questions, results), 1):
+        with buffered_output():
+            print(f"\n📝 Question {i}: {question}")
+            print("-" * 60)
+
+            if "error" in result:
+                print(f"❌ Error: {result['error']}")
+                continue
+
+            # Display results
+            print(f"🎯 Question Type: {result.get('question_type', 'N/A')}")
+
+            print(f"📚 Topics ({len(result.get('topics', []))}):")
+            for topic in result.get('topics', []):
+                print(f"   • {topic}")
+
+            print(f"📖 Sections ({len(result.get('sections', []))}):")
+            for section in result.get('sections', []):
+                print(f"   • {section}")
+
+            print(f"⚖️ Legal Concepts ({len(result.get('legal_concepts', []))}):")
+            for concept in result.get('legal_concepts', []):
+                print(f"   • {concept}")
 
-def split_question_basic(question: str) -> List[str]:
+            # Evaluate the parsing quality
+            topics = result.get('topics', [])
+            sections = result.get('sections', [])
+            concepts = result.get('legal_concepts', [])
+
+            quality_score = 0
+            if topics: quality_score += 1
+            if sections: quality_score += 1  
+            if concepts: quality_score += 1
+            if len(topics) >= 2: quality_score += 1  # Multiple topics for complex questions
+            if _KEYWORD_RE.search("\n".join(sections)): quality_score += 1
+
+            print(f"✅ Quality Score: {quality_score}/5")
+
+            if quality_score >= 4:
+                print("🎉 Excellent parsing!")
+            elif quality_score >= 3:
+                print("👍 Good parsing")
+            else:
+                print("⚠️ Needs improvement")
+
+async def split_question_basic(client: AsyncOpenAI, question: str) -> List[str]:
     """
     Basic approach - simple splitting with truncation.
     """
     try:
-        response = client.chat.completions.create(
+        response = await cached_chat_completion(
+            client,
             model="gpt-4o-mini",
             messages=[
-                {
-                    "role": "system",
-                    "content": "Break down complex legal questions into simpler sub-questions. Return only the sub-questions, one per line, without numbering or bullets."
-                },
+                BASIC_SPLIT_SYSTEM_MESSAGE,
                 {
                     "role": "user",
                     "content": f"Break down this question: '{question}'"
                 }
             ],
-            max_tokens=200
+            max_tokens=200,
+            temperature=0
         )
         
         sub_questions = response.choices[0].message.content.strip().split('\n')
@@ -182,24 +339,23 @@ def split_question_basic(question: str) -> List[str]:
     except Exception as e:
         return [f"Error: {e}"]
 
-def split_question_smart(question: str) -> List[str]:
+async def split_question_smart(client: AsyncOpenAI, question: str) -> List[str]:
     """
     Smart approach - let OpenAI decide optimal number with quality focus.
     """
     try:
-        response = client.chat.completions.create(
+        response = await cached_chat_completion(
+            client,
             model="gpt-4o-mini",
             messages=[
-                {
-                    "role": "system",
-                    "content": "Break down this legal question into the most essential sub-questions needed to answer it completely. Focus on core concepts that must be addressed and distinct aspects that need separate consideration. Avoid redundant or overly specific questions. Return only the most relevant sub-questions, one per line, without numbering."
-                },
+                SMART_SPLIT_SYSTEM_MESSAGE,
                 {
                     "role": "user",
                     "content": f"Question: '{question}'"
                 }
             ],
-            max_tokens=200
+            max_tokens=200,
+            temperature=0
         )
         
         sub_questions = response.choices[0].message.content.strip().split('\n')
@@ -208,57 +364,30 @@ def split_question_smart(question: str) -> List[str]:
     except Exception as e:
         return [f"Error: {e}"]
 
-def split_question_structured(question: str) -> Dict:
+async def split_question_structured(client: AsyncOpenAI, question: str) -> Dict:
     """
     Structured approach - function calling with reasoning.
     """
-    functions = [
-        {
-            "name": "analyze_question_complexity",
-            "description": "Analyze question complexity and extract essential sub-questions",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "complexity": {
-                        "type": "string",
-                        "enum": ["simple", "medium", "complex"],
-                        "description": "Question complexity level"
-                    },
-                    "sub_questions": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Essential sub-questions needed to answer the original question"
-                    },
-                    "reasoning": {
-                        "type": "string", 
-                        "description": "Brief explanation of why these sub-questions were selected"
-                    }
-                },
-                "required": ["complexity", "sub_questions", "reasoning"]
-            }
-        }
-    ]
-    
     try:
-        response = client.chat.completions.create(
+        response = await cached_chat_completion(
+            client,
             model="gpt-4o-mini",
             messages=[
-                {
-                    "role": "system", 
-                    "content": "You are an expert at analyzing questions and breaking them down into essential components. Analyze the given question and break it down into the most essential sub-questions needed to provide a complete answer. Focus on distinct aspects that require separate consideration."
-                },
+                ANALYZE_SYSTEM_MESSAGE,
                 {
                     "role": "user", 
                     "content": f"Analyze this question: '{question}'"
                 }
             ],
-            functions=functions,
-            function_call={"name": "analyze_question_complexity"}
+            functions=FUNCTIONS_ANALYZE,
+            function_call=ANALYZE_FUNCTION_CALL,
+            max_tokens=300,
+            temperature=0
         )
         
         function_call = response.choices[0].message.function_call
         if function_call and function_call.name == "analyze_question_complexity":
-            return json.loads(function_call.arguments)
+            return orjson.loads(function_call.arguments)
         else:
             return {"error": "No function call returned"}
             
@@ -269,6 +398,12 @@ def test_question_splitting_comparison():
     """
     Test all three approaches and compare results.
     """
+    run_on_loop(run_with_client(question_splitting_comparison))
+
+async def question_splitting_comparison(client: AsyncOpenAI):
+    """
+    Body of test_question_splitting_comparison.
+    """
     
     print("\n\n🔬 Testing Question Splitting Approaches")
     print("=" * 80)
@@ -280,54 +415,58 @@ def test_question_splitting_comparison():
     ]
     
     for i, question in enumerate(test_questions, 1):
-        print(f"\n📝 Question {i}: {question}")
-        print("-" * 80)
-        
-        # Test all three approaches
-        print("\n🔹 Approach 1: Basic (Truncated to 3)")
-        basic_results = split_question_basic(question)
-        print(f"   Count: {len(basic_results)}")
-        for j, sub_q in enumerate(basic_results, 1):
-            print(f"   {j}. {sub_q}")
-        
-        print("\n🔹 Approach 2: Smart (Quality Focus)")
-        smart_results = split_question_smart(question)
-        print(f"   Count: {len(smart_results)}")
-        for j, sub_q in enumerate(smart_results, 1):
-            print(f"   {j}. {sub_q}")
+        # Run all three approaches concurrently, then print in order
+        basic_results, smart_results, structured_results = await asyncio.gather(
+            split_question_basic(client, question),
+            split_question_smart(client, question),
+            split_question_structured(client, question)
+        )
         
-        print("\n🔹 Approach 3: Structured (With Reasoning)")
-        structured_results = split_question_structured(question)
-        if "error" not in structured_results:
-            print(f"   Complexity: {structured_results.get('complexity', 'N/A')}")
-            print(f"   Count: {len(structured_results.get('sub_questions', []))}")
-            print(f"   Reasoning: {structured_results.get('reasoning', 'N/A')}")
-            for j, sub_q in enumerate(structured_results.get('sub_questions', []), 1):
+        with buffered_output():
+            print(f"\n📝 Question {i}: {question}")
+            print("-" * 80)
+
+            print("\n🔹 Approach 1: Basic (Truncated to 3)")
+            print(f"   Count: {len(basic_results)}")
+            for j, sub_q in enumerate(basic_results, 1):
                 print(f"   {j}. {sub_q}")
-        else:
-            print(f"   Error: {structured_results['error']}")
-        
-        # Analysis
-        print(f"\n📊 Analysis:")
-        print(f"   Basic: {len(basic_results)} sub-questions")
-        print(f"   Smart: {len(smart_results)} sub-questions")
-        if "error" not in structured_results:
-            print(f"   Structured: {len(structured_results.get('sub_questions', []))} sub-questions")
-        
-        # Determine best approach
-        if "error" not in structured_results:
-            structured_count = len(structured_results.get('sub_questions', []))
-            if structured_count <= len(smart_results) and structured_count <= len(basic_results):
-                print(f"   🏆 Winner: Structured approach (most concise)")
-            elif len(smart_results) <= len(basic_results):
-                print(f"   🏆 Winner: Smart approach (good balance)")
+
+            print("\n🔹 Approach 2: Smart (Quality Focus)")
+            print(f"   Count: {len(smart_results)}")
+            for j, sub_q in enumerate(smart_results, 1):
+                print(f"   {j}. {sub_q}")
+
+            print("\n🔹 Approach 3: Structured (With Reasoning)")
+            if "error" not in structured_results:
+                print(f"   Complexity: {structured_results.get('complexity', 'N/A')}")
+                print(f"   Count: {len(structured_results.get('sub_questions', []))}")
+                print(f"   Reasoning: {structured_results.get('reasoning', 'N/A')}")
+                for j, sub_q in enumerate(structured_results.get('sub_questions', []), 1):
+                    print(f"   {j}. {sub_q}")
             else:
-                print(f"   🏆 Winner: Basic approach (simplest)")
-        else:
-            if len(smart_results) <= len(basic_results):
-                print(f"   🏆 Winner: Smart approach")
+                print(f"   Error: {structured_results['error']}")
+
+            # Analysis
+            print(f"\n📊 Analysis:")
+            print(f"   Basic: {len(basic_results)} sub-questions")
+            print(f"   Smart: {len(smart_results)} sub-questions")
+            if "error" not in structured_results:
+                print(f"   Structured: {len(structured_results.get('sub_questions', []))} sub-questions")
+
+            # Determine best approach
+            if "error" not in structured_results:
+                structured_count = len(structured_results.get('sub_questions', []))
+                if structured_count <= len(smart_results) and structured_count <= len(basic_results):
+                    print(f"   🏆 Winner: Structured approach (most concise)")
+                elif len(smart_results) <= len(basic_results):
+                    print(f"   🏆 Winner: Smart approach (good balance)")
+                else:
+                    print(f"   🏆 Winner: Basic approach (simplest)")
             else:
-                print(f"   🏆 Winner: Basic approach")
+                if len(smart_results) <= len(basic_results):
+                    print(f"   🏆 Winner: Smart approach")
+                else:
+                    print(f"   🏆 Winner: Basic approach")
 
 if __name__ == "__main__":
     # Check if OpenAI API key is set
@@ -336,9 +475,12 @@ if __name__ == "__main__":
         print("Please check your .env file or environment variables")
         exit(1)
     
-    # Run tests
-    test_question_parsing()
-    test_question_splitting_comparison()
+    # Run tests on one event loop, sharing one client
+    async def main(client: AsyncOpenAI):
+        await question_parsing(client)
+        await question_splitting_comparison(client)
+    
+    run_on_loop(run_with_client(main))
     
     print("\n\n🎯 Summary")
     print("=" * 80)
@@ -1,12 +1,12 @@
-import redis
-from app.config import settings
-
-r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db)
-
-r.set("test_key", "Hello, Redis!")
-value = r.get("test_key")
-
-print(f"value: {value.decode('utf-8')}")
-
-r.setex("temp_key", 10, "This expires in 10 seconds")
-print(f"TTL: {r.ttl('temp_key')} seconds")
\ No newline at end of file
+from app.redis_client import redis_client as r
+
+# All four commands in one round-trip
+with r.pipeline(transaction=False) as pipe:
+    pipe.set("test_key", "Hello, Redis!")
+    pipe.get("test_key")
+    pipe.setex("temp_key", 10, "This expires in 10 seconds")
+    pipe.ttl("temp_key")
+    _, value, _, ttl = pipe.execute()
+
+print(f"value: {value}")
+print(f"TTL: {ttl} seconds")
\ No newline at end of file